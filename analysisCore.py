@@ -0,0 +1,1341 @@
+from typing import Dict, List, Optional, Tuple, Union
+from array import array
+import configparser
+from datetime import date
+import chess
+import chess.engine
+import chess.pgn
+import os.path
+import os
+import threading
+import time
+import copy
+import heapq
+import traceback
+from enginePool import EnginePool, AnalysisRequest, AnalysisResult, AnalysisLines
+from analysisServer import AnalysisServer
+from evaluationStore import EvaluationStore, positionKey
+from positionKeys import boardKey, moveKey
+from evaluationJournal import EvaluationJournal
+from positionTree import PositionTree, PositionTreeBuilder, BoardCache, ROOT, NO_NODE
+from nodeTables import NodeTables, EvaluationStats
+from gamesSummary import GamesSummary
+from gamesFilter import GamesFilter, ANY_TIME_CONTROL, TIME_CONTROLS
+from gameIndex import GameEntry, loadGameEntries, readGameEntry, readGames
+from combinedStore import CombinedStore
+from ecoBook import EcoInfo, UNKNOWN_ECO_INFO, loadEcoInfos
+
+WHITE = 'White'
+BLACK = 'Black'
+COLORS = [WHITE, BLACK]
+
+MISTAKE = 'mistake'
+UNACCURACY = 'unaccuracy'
+NORMAL = 'normal'
+
+MISTAKES_TABLE_HEADINGS = ['Move #', 'Variant', 'Move', 'Eval', 'Change', 'Best', 'Depth']
+BAD_RESULTS_TABLE_HEADINGS = ['Variant', 'Games', 'Wins', 'Losts', 'Draws']
+
+COMBINED_STORE_EXTENSION = '.sqlite'  # extension of combined game kept in sqlite store instead of pgn
+ANALYSIS_PROCESSING_TIME = 0.1  # seconds engine results are processed in single call of processAnalysisResults
+OPERATION_PRINT_INTERVAL = 5.0  # seconds between operation progress prints
+
+
+## class combibes eco info and node in game with specific position
+class EcoInfoWithNode:
+    ecoInfo: EcoInfo
+    node: int  # node in combined tree
+
+    def __init__(self, ecoInfo: EcoInfo, node: int) -> None:
+        self.ecoInfo = ecoInfo
+        self.node = node
+
+    def __hash__(self):
+        return hash(self.ecoInfo)
+
+
+## class for game Node statistics
+class GameStats:
+    totalGames: int
+    white: int
+    black: int
+    draws: int
+    gamesTable: List[List[str]]
+    gamesList: List[int]
+
+    def __init__(self, white: int, black: int, draws: int, gamesTable: List[List[str]], gamesList: List[int]) -> None:
+        self.totalGames = white + black + draws
+        self.white = white
+        self.black = black
+        self.draws = draws
+        self.gamesTable = gamesTable
+        self.gamesList = gamesList
+
+    def getLostAndDrawsRatio(self, color: str) -> float:
+        if color == WHITE:
+            return (self.black + 0.5 * self.draws) / self.totalGames
+        else:
+            return (self.white + 0.5 * self.draws) / self.totalGames
+
+    def whiteStr(self):
+        return '{} ({}%)'.format(self.white, round(self.white * 100 / self.totalGames))
+
+    def blackStr(self):
+        return '{} ({}%)'.format(self.black, round(self.black * 100 / self.totalGames))
+
+    def drawStr(self):
+        return '{} ({}%)'.format(self.draws, round(self.draws * 100 / self.totalGames))
+
+    def __str__(self):
+        return 'white={}, black={}, draws={}, gamesTable={}'.format(self.white, self.black, self.draws, self.gamesTable)
+
+    def __add__(self, other):
+        return GameStats(self.white + other.white,
+                         self.black + other.black,
+                         self.draws + other.draws,
+                         self.gamesTable + other.gamesTable,
+                         self.gamesList + other.gamesList)
+
+    def __iadd__(self, other):
+        self.totalGames = self.totalGames + other.totalGames
+        self.white = self.white + other.white
+        self.black = self.black + other.black
+        self.draws = self.draws + other.draws
+        self.gamesTable = self.gamesTable + other.gamesTable
+        self.gamesList = self.gamesList + other.gamesList
+        assert (self.totalGames == self.white + self.black + self.draws)
+        return self
+
+
+## class containes state of running analysis pass
+class AnalysisState:
+    pool: Optional[Union[EnginePool, AnalysisServer]]  # local engines or server of workers analyzing positions, it
+    # is started when first position is sent to analysis
+    depth: int  # depth of search
+    multiPV: int  # number of lines engine searches in every position
+    evaluated: int  # number of evaluated nodes
+    savedEngineCalls: int  # number of nodes scored by MultiPV lines of the parent search
+    transposedNodes: int  # number of nodes which got score of same position searched for another node
+    deep: bool  # True for deep analysis pass, which rescores already evaluated nodes
+    positionKeyToNodes: Dict[int, List[int]]  # positions sent to engines and nodes waiting for them
+    waitingForParent: Dict[int, List[List[Union[int, float, Optional[str]]]]]  # results
+    # which came before result of their parent
+    waitingForLines: Dict[int, List[int]]  # MultiPV mode: nodes waiting for parent search
+    nodeToLines: Dict[int, AnalysisLines]  # MultiPV mode: lines of searched nodes not scheduled yet
+
+    def __init__(self, pool: Optional[Union[EnginePool, AnalysisServer]], depth: int, multiPV: int,
+                 deep: bool = False) -> None:
+        self.pool = pool
+        self.depth = depth
+        self.multiPV = multiPV
+        self.deep = deep
+        self.evaluated = 0
+        self.savedEngineCalls = 0
+        self.transposedNodes = 0
+        self.positionKeyToNodes = {}
+        self.waitingForParent = {}
+        self.waitingForLines = {}
+        self.nodeToLines = {}
+
+
+## Operation class - prints operation progress and throughput to stdout
+class Operation:
+    operationName: str
+    maxValue: int
+    startTime: float  # time operation started
+    lastPrintTime: float  # time progress was printed last time
+
+    def __init__(self, operationName: str, maxValue: int):
+        self.operationName = operationName
+        self.maxValue = maxValue
+        self.startTime = time.monotonic()
+        self.lastPrintTime = self.startTime
+
+    def __enter__(self):
+        self.startTime = time.monotonic()
+        self.lastPrintTime = self.startTime
+        print('{} (0/{})'.format(self.operationName, self.maxValue))
+        return self
+
+    def update(self, count):
+        now = time.monotonic()
+        if now - self.lastPrintTime >= OPERATION_PRINT_INTERVAL:
+            self.lastPrintTime = now
+            print('{} ({}/{}) {:.1f}/s'.format(self.operationName, count, self.maxValue,
+                                               count / (now - self.startTime)))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.monotonic() - self.startTime
+        print('{} finished in {:.1f}s'.format(self.operationName, elapsed))
+
+
+## Games analysis without UI: loads pgn, filters games, builds combined pgn, analyzes it and builds statistics tables
+class AnalysisCore:
+    config: configparser.RawConfigParser  # config parser
+    clearStages: Dict[str, int]  # on every stage clear operation must clear staff specific to stage
+    filename: Optional[str]  # pgn filename
+    pgnAllGames: List[GameEntry]  # headers and positions of all the games in pgn file
+    filteredPgnGames: List[GameEntry]  # games filtered by UI filter, their moves are parsed by combined pgn building
+    gamesSummary: GamesSummary  # parsed headers of filtered games
+    gamesFilter: GamesFilter  # index of all the games by player and color for filtering
+    player: Optional[str]  # player name
+    color: Optional[str]  # player's color
+    fromDate: Optional[date]  # start date for filtering
+    tillDate: Optional[date]  # end date for filtering
+    minElo: Optional[int]  # minimal opponent elo for filtering, None if there is no limit
+    maxElo: Optional[int]  # maximal opponent elo for filtering, None if there is no limit
+    timeControl: str  # time control for filtering (ANY_TIME_CONTROL for all the games)
+
+    combinedFilename: Optional[str]  # filename of pgn contains combined game and filtered games
+    journal: Optional[EvaluationJournal]  # evaluations which were not folded into combined pgn yet
+    combinedStore: Optional[CombinedStore]  # combined game kept in sqlite store, None for combined pgn
+    combinedTree: Optional[PositionTree]  # tree of positions combined from all filtered games
+    currentNode: Optional[int]  # node in combined tree currently shown in board and analysis tree
+    boardCache: Optional[BoardCache]  # positions of combined tree nodes
+    totalNumberOfNodes: Optional[int]  # number of nodes in combined tree (without transpositions)
+
+    keyToEcoInfo: Dict[int, EcoInfo]  # map from position key to eco info
+    loadedEcoBook: Optional[Dict[int, EcoInfo]]  # eco book loaded in background, not applied yet
+    ecoNodes: array  # deepest node with eco book position on the path to node (NO_NODE if none) for every node
+    mistakeNodes: List[int]  # nodes considered to be mistake
+    unaccuracyNodes: List[int]  # nodes considered to be Unaccuracy
+
+    nodeTables: NodeTables  # games and evaluations of combined tree nodes
+    mistakesTableInfo: List[EcoInfoWithNode]  # list of Eco information and node for current mistakes table
+    badGamesTableInfo: List[List[Union[EcoInfoWithNode, List[int]]]]  # info for current bad games table
+    lock: threading.Lock  # lock for various variables that analysis updates
+    analysisState: Optional[AnalysisState]  # state of running analysis pass, None if analysis is not running
+    analysisOperation: Optional[Operation]  # progress of running analysis pass
+    analysisNodesList: List[int]  # nodes of running analysis in the order they are analyzed
+    evaluationStore: EvaluationStore  # evaluations of positions shared between all combined pgns
+
+    def __init__(self, configFile: str) -> None:
+        self.config = configparser.RawConfigParser()
+        self.config.read(configFile)
+
+        self.clearStages = dict(setFilename=0, loadPgnFile=1, refreshPerod=2, buildCombinedPgn=3, loadCombinedPgn=4,
+                                showAnalisysTree=5)
+        # pgn filename staff
+        self.filename = None
+        self.pgnAllGames = []
+        self.filteredPgnGames = []
+        self.gamesSummary = GamesSummary()
+        self.gamesFilter = GamesFilter()
+        self.player = None
+        self.color = None
+        self.fromDate = None
+        self.tillDate = None
+        self.minElo = None
+        self.maxElo = None
+        self.timeControl = ANY_TIME_CONTROL
+
+        # combined pgn staff
+        self.combinedFilename = None
+        self.journal = None
+        self.combinedStore = None
+        self.combinedTree = None
+        self.currentNode = None
+        self.boardCache = None
+        self.totalNumberOfNodes = None
+
+        # caches and maps
+        self.keyToEcoInfo = {}
+        self.loadedEcoBook = None
+        self.ecoNodes = array('i')
+        self.nodeTables = NodeTables()
+        self.evaluationStore = EvaluationStore(self.config.get('engine', 'evaluationStore'))
+
+        self.mistakeNodes = []
+        self.unaccuracyNodes = []
+
+        self.mistakesTableInfo = []
+        self.badGamesTableInfo = []
+
+        # analysis staff
+        self.lock = threading.Lock()
+        self.analysisState = None
+        self.analysisOperation = None
+        self.analysisNodesList = []
+
+    #################################################### Helpers #######################################################
+    ## operation start, prints progress
+    def startOperation(self, operation: str, max_value: int) -> Operation:
+        return Operation(operation, max_value)
+
+    ## reports error
+    def showError(self, message: str) -> None:
+        print('ERROR: {}'.format(message))
+
+    ## clears according to stage
+    def clear(self, stage: str) -> None:
+        if self.clearStages[stage] <= self.clearStages['setFilename']:
+            self.filename = None
+
+        if self.clearStages[stage] <= self.clearStages['loadPgnFile']:
+            self.pgnAllGames.clear()
+            self.gamesFilter.clear()
+            self.player = None
+
+        if self.clearStages[stage] <= self.clearStages['refreshPerod']:
+            self.filteredPgnGames.clear()
+            self.gamesSummary.clear()
+            self.color = None
+            self.fromDate = None
+            self.tillDate = None
+            self.minElo = None
+            self.maxElo = None
+            self.timeControl = ANY_TIME_CONTROL
+
+        if self.clearStages[stage] <= self.clearStages['buildCombinedPgn']:
+            self.combinedFilename = None
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = None
+            if self.combinedStore is not None:
+                self.combinedStore.close()
+            self.combinedStore = None
+        if self.clearStages[stage] <= self.clearStages['loadCombinedPgn']:
+            self.combinedTree = None
+            self.currentNode = None
+            self.boardCache = None
+            self.nodeTables.clear()
+            self.ecoNodes = array('i')
+
+    ## calculates number of nodes in combined tree
+    def calcNodesNumber(self) -> int:
+        # don't count refernces
+        num = 0
+        for node in range(len(self.combinedTree)):
+            if not self.combinedTree.isTransposition(node):
+                num += 1
+        return num
+
+    # builds nodes list with BFS
+    def buildBFSNodesList(self) -> List[int]:
+        with self.startOperation('Building list to analyaze', self.totalNumberOfNodes) as operation:
+            i = 0
+            resultList = []
+            workingList = [ROOT]
+            while len(workingList) != 0:
+                node = workingList.pop(0)
+                operation.update(i)
+                resultList.append(node)
+                for variation in self.combinedTree.children(node):
+                    if not self.combinedTree.isTransposition(variation):
+                        workingList.append(variation)
+                i += 1
+            assert (len(resultList) == self.totalNumberOfNodes)
+        return resultList
+
+    # returns number of games passing through node
+    def getNodeGamesNumber(self, node: int) -> int:
+        return self.nodeTables.getGamesNumber(node)
+
+    # builds nodes list ordered by number of games passing through node, parent is always before its children
+    def buildPriorityNodesList(self) -> List[int]:
+        with self.startOperation('Building list to analyaze', self.totalNumberOfNodes) as operation:
+            resultList = []
+            # heap entry is (-games number, order of insertion, node), so node with more games goes first
+            order: int = 0
+            heap: List[Tuple[int, int, int]] = [(0, order, ROOT)]
+            while len(heap) != 0:
+                _, _, node = heapq.heappop(heap)
+                operation.update(len(resultList))
+                resultList.append(node)
+                for variation in self.combinedTree.children(node):
+                    if not self.combinedTree.isTransposition(variation):
+                        order += 1
+                        heapq.heappush(heap, (-self.getNodeGamesNumber(variation), order, variation))
+            assert (len(resultList) == self.totalNumberOfNodes)
+        return resultList
+
+    # returns move clasification (mistake,unaccuracy, normal)
+    def classifyMove(self, scoreChange: float, color: str) -> str:
+        mistakeMoveChange: float = self.config.getfloat('moves_classification', 'mistakeMoveChange')
+        unaccuracyMoveChange: float = self.config.getfloat('moves_classification', 'unaccuracyMoveChange')
+        if (scoreChange < -mistakeMoveChange and color == chess.WHITE) or \
+                (scoreChange > mistakeMoveChange and color == chess.BLACK):
+            return MISTAKE
+        else:
+            if (scoreChange < -unaccuracyMoveChange and color == chess.WHITE) or \
+                    (scoreChange > unaccuracyMoveChange and color == chess.BLACK):
+                return UNACCURACY
+            else:
+                return NORMAL
+
+    # loads ECO book (from compiled eco book if it is valid)
+    def loadEcoBook(self) -> None:
+        try:
+            ecoFilename: str = self.config.get('eco', 'ecoBook')
+            with self.startOperation('Download Eco Book', os.path.getsize(ecoFilename)) as operation:
+                self.setEcoBook(loadEcoInfos(ecoFilename, operation.update))
+        except:
+            traceback.print_exc()
+            self.showError('Unable to load eco book')
+
+    ## sets eco book and classifies nodes of combined tree by it
+    def setEcoBook(self, keyToEcoInfo: Dict[int, EcoInfo]) -> None:
+        self.keyToEcoInfo = keyToEcoInfo
+        if self.combinedTree is not None:
+            self.classifyEcoNodes()
+
+    ## loads ECO book by background thread, so window is shown immediately. Book is set by applyLoadedEcoBook in
+    ## the thread of the window events loop
+    def loadEcoBookInBackground(self) -> None:
+        threading.Thread(target=self.ecoBookThread, args=(self.config.get('eco', 'ecoBook'),), daemon=True).start()
+
+    ## loads ECO book in background thread
+    def ecoBookThread(self, ecoFilename: str) -> None:
+        try:
+            startTime = time.monotonic()
+            keyToEcoInfo: Dict[int, EcoInfo] = loadEcoInfos(ecoFilename, lambda x: None)
+            print('Eco book loaded in {:.1f}s'.format(time.monotonic() - startTime))
+            with self.lock:
+                self.loadedEcoBook = keyToEcoInfo
+        except:
+            traceback.print_exc()
+            print('Unable to load eco book')
+
+    ## sets eco book loaded in background (if it is loaded), returns True if book is set
+    def applyLoadedEcoBook(self) -> bool:
+        with self.lock:
+            keyToEcoInfo: Optional[Dict[int, EcoInfo]] = self.loadedEcoBook
+            self.loadedEcoBook = None
+        if keyToEcoInfo is None:
+            return False
+        self.setEcoBook(keyToEcoInfo)
+        return True
+
+    ## finds eco node of every node of combined tree in one top-down pass (parent id is always less than child id)
+    def classifyEcoNodes(self) -> None:
+        self.ecoNodes = array('i', [NO_NODE]) * len(self.combinedTree)
+        keys: array = self.combinedTree.positionKeys
+        parents: array = self.combinedTree.parents
+        for node in range(len(self.combinedTree)):
+            if keys[node] in self.keyToEcoInfo:
+                self.ecoNodes[node] = node
+            elif node != ROOT:
+                self.ecoNodes[node] = self.ecoNodes[parents[node]]
+
+    # Returns node games info
+    def getNodeGameStats(self, node: int) -> GameStats:
+        if self.combinedTree.isTransposition(node):
+            return self.getNodeGameStats(self.combinedTree.targets[node])
+
+        gameNumbers = self.nodeTables.getGames(node)
+        white, black, draw = self.nodeTables.getResults(node)
+        table_to_show = []
+        gamesList: List[int] = []
+        for i in gameNumbers:
+            gamesList.append(i)
+            table_to_show.append(self.gamesSummary.row(i))
+
+        assert (white + black + draw == len(gameNumbers))
+        return GameStats(white, black, draw, table_to_show, gamesList)
+
+    # returns results counts of node games (without games table)
+    def getNodeResults(self, node: int) -> GameStats:
+        if self.combinedTree.isTransposition(node):
+            node = self.combinedTree.targets[node]
+        white, black, draw = self.nodeTables.getResults(node)
+        return GameStats(white, black, draw, [], [])
+
+    # returns games passing through node
+    def getNodeGames(self, node: int) -> array:
+        if self.combinedTree.isTransposition(node):
+            node = self.combinedTree.targets[node]
+        return self.nodeTables.getGames(node)
+
+    # returns most close eco entry in book
+    def getNodeEcoEntry(self, node: int) -> Optional[EcoInfoWithNode]:
+        ecoNode: int = self.ecoNodes[node]
+        if ecoNode == NO_NODE:
+            return None
+        return EcoInfoWithNode(self.keyToEcoInfo[self.combinedTree.positionKeys[ecoNode]], ecoNode)
+
+    # Evaluates nodes that are lower than given depth (half_moves, odd-is white, even - black) from start game
+    def scanNodesToDepth(self, node: int, half_moves: int, remaining_half_moves: int,
+                         evaluateNode: callable, ignoreReferences: bool = False) -> None:
+        if (ignoreReferences is False) and self.combinedTree.isTransposition(node):
+            node = self.combinedTree.targets[node]
+        evaluateNode(node, half_moves)
+        if remaining_half_moves == 0:
+            return
+        for variation in self.combinedTree.children(node):
+            self.scanNodesToDepth(variation, half_moves + 1, remaining_half_moves - 1, evaluateNode, ignoreReferences)
+
+    ## adds node and all its descedents to the combined tree node
+    def addNode(self, combinedNode: int, moves: List[chess.Move], gameNumber: int, board: chess.Board,
+                inKeyCache: Dict[int, int], outKeyCache: Dict[int, int]) -> None:
+        for move in moves:
+            new_node: int = self.combinedTree.findChild(combinedNode, move)
+            if new_node == NO_NODE:
+                new_node = self.combinedTree.addNode(combinedNode, move, board)
+            self.nodeTables.addGame(new_node, gameNumber)
+            board.push(move)
+            # combined node has the position after the move
+            combinedNode = new_node
+            key: int = self.combinedTree.positionKeys[combinedNode]
+            if key in inKeyCache:
+                if combinedNode != inKeyCache[key]:
+                    # we found same position put current combined node as a reference
+                    self.combinedTree.setTarget(combinedNode, inKeyCache[key])
+                    self.nodeTables.clearGames(combinedNode)
+                    combinedNode = inKeyCache[key]
+            else:
+                # if it is not in inKey cache put it to the out key cache
+                outKeyCache[key] = combinedNode
+
+    ## adds game moves to the output game node, end of the game gets comment
+    def addOutNode(self, outNode: chess.pgn.GameNode, moves: List[chess.Move], board: chess.Board, key: int,
+                   outKeyCache: Dict[int, chess.pgn.GameNode], endGameComment: str) -> None:
+        for move in moves:
+            key = moveKey(key, board, move)
+            board.push(move)
+            if outNode.has_variation(move):
+                outNode = outNode.variation(move)
+            else:
+                outNode = outNode.add_variation(move)
+            outKeyCache[key] = outNode
+        outNode.comment += endGameComment
+
+    # annotates mistakes or errors in output pgn
+    def annotateOutGame(self, gameNumber: int, keyCache: Dict[int, chess.pgn.GameNode],
+                        nodesList: List[int], annotationStr: str):
+        for node in nodesList:
+            if gameNumber in self.getNodeGames(node):
+                evalStats = self.nodeTables.getEvaluation(node)
+                if evalStats is not None:
+                    key = self.combinedTree.positionKeys[node]
+                    assert (key in keyCache)
+                    out_mistake_node = keyCache[key]
+                    if out_mistake_node.comment == '':
+                        out_mistake_node.comment = '{}, score={} change={}'.format(annotationStr, evalStats.scoreStr(),
+                                                                                   evalStats.changeStr())
+
+    # saves annotated output pgn
+    def buildOutPgn(self, nodes: List[int], out_filename):
+        result_game = chess.pgn.Game()
+        for node in nodes:
+            for gameNumber in self.getNodeGames(node):
+                gameRow = self.gamesSummary.row(gameNumber)
+                outKeyCache: Dict[int, chess.pgn.GameNode] = {}
+                endGameComment = '{} ({}) - {} ({}), {}, {}'.format(gameRow[1], gameRow[2], gameRow[3], gameRow[4],
+                                                                    gameRow[5], gameRow[0])
+                self.addOutNode(result_game, self.filteredPgnGames[gameNumber].mainlineMoves(), result_game.board(),
+                                boardKey(result_game.board()), outKeyCache, endGameComment)
+
+                # Annotate
+                with self.lock:
+                    mistakeNodes = copy.copy(self.mistakeNodes)
+                    unaccuracyNodes = copy.copy(self.unaccuracyNodes)
+                self.annotateOutGame(gameNumber, outKeyCache, mistakeNodes, MISTAKE)
+                self.annotateOutGame(gameNumber, outKeyCache, unaccuracyNodes, UNACCURACY)
+
+        with open(out_filename, encoding='utf-8', mode='w') as file:
+            print(result_game, file=file, end='\n\n')
+
+    ############################################## Combined pgn buildig ################################################
+    def checkNodeForReferenceBuilding(self, node: int, keyCache: Dict[int, int], referencesList: List[int],
+                                      operation: Operation) -> None:
+
+        operation.update(len(keyCache.keys()))
+        if self.combinedTree.isTransposition(node):
+            referencesList.append(node)
+            return
+        keyCache[self.combinedTree.positionKeys[node]] = node
+
+    def buildReferences(self) -> None:
+        with self.startOperation('Build references', self.totalNumberOfNodes) as operation:
+            keyCache: Dict[int, int] = {}
+            referncesList: List[int] = []
+            self.scanNodesToDepth(ROOT, 0, 10000,
+                                  lambda x, y: self.checkNodeForReferenceBuilding(x, keyCache, referncesList,
+                                                                                  operation),
+                                  True)
+            for node in referncesList:
+                key = self.combinedTree.positionKeys[node]
+                assert (key in keyCache)
+                self.combinedTree.setTarget(node, keyCache[key])
+
+    ## returns filename of journal of combined pgn
+    def journalFilename(self) -> str:
+        return self.combinedFilename + '.journal'
+
+    ## applies evaluations from journal, which were not folded into combined pgn yet
+    def replayJournal(self) -> int:
+        replayed: int = 0
+        for path, score, change, bestMove, depth in self.journal.replay():
+            node: int = self.combinedTree.findPath(path)
+            # later entry of the node (deeper analysis) replaces previous one
+            if node != NO_NODE:
+                self.nodeTables.setEvaluation(node, EvaluationStats(score, change, bestMove, depth))
+                replayed += 1
+        return replayed
+
+    ## returns True if combined game is kept in sqlite store instead of pgn
+    def isCombinedStore(self) -> bool:
+        return self.combinedFilename.endswith(COMBINED_STORE_EXTENSION)
+
+    ## Loads combined game from sqlite store
+    def loadCombinedStore(self) -> bool:
+        try:
+            with self.startOperation('Load combined store', 1) as operation:
+                self.combinedStore = CombinedStore(self.combinedFilename,
+                                                   self.config.getint('engine', 'analyzedMovesToSave'))
+                self.combinedTree, self.filteredPgnGames, self.player, self.totalNumberOfNodes = \
+                    self.combinedStore.load(self.nodeTables)
+                self.boardCache = BoardCache(self.combinedTree)
+                self.currentNode = ROOT
+                self.classifyEcoNodes()
+                self.gamesSummary.build(self.filteredPgnGames)
+                self.nodeTables.countResults(self.gamesSummary.results)
+                operation.update(1)
+                return True
+        except:
+            traceback.print_exc()
+            if self.combinedStore is not None:
+                self.combinedStore.close()
+            self.combinedStore = None
+            os.remove(self.combinedFilename)
+            self.clear('loadCombinedPgn')
+            return False
+
+    ## Loads combined pgn
+    def loadCombinedPgn(self) -> bool:
+        self.clear('loadCombinedPgn')
+        if self.combinedFilename is None:
+            return False
+        if self.isCombinedStore():
+            return self.loadCombinedStore()
+
+        self.journal = EvaluationJournal(self.journalFilename(),
+                                         self.config.getint('engine', 'analyzedMovesToSave'))
+        try:
+            with self.startOperation('Load combined pgn', 200) as operation:
+                with open(self.combinedFilename, encoding='utf-8') as pgn:
+                    # load first game it is actually half of entire pgn, it is read directly into positions tree
+                    builder = PositionTreeBuilder()
+                    self.combinedTree = chess.pgn.read_game(pgn, Visitor=lambda: builder)
+                    if self.combinedTree is None:
+                        print('No combined game')
+                        raise Exception('No combined game')
+                    # comments are moved to the node tables
+                    gamesNumber = self.nodeTables.readComments(self.combinedTree, builder.comments)
+                    self.boardCache = BoardCache(self.combinedTree)
+                    operation.update(100)
+                    self.player = builder.headers[self.color]
+                    self.currentNode = ROOT
+                    print('{} evaluations replayed from journal'.format(self.replayJournal()))
+
+                    self.totalNumberOfNodes = self.calcNodesNumber()
+                    self.classifyEcoNodes()
+                    gamesList = []
+                    i = 0
+                    while True:
+                        entry: Optional[GameEntry] = readGameEntry(pgn)
+                        if entry is not None:
+                            gamesList.append(entry)
+                            i = i + 1
+                            if i > gamesNumber:
+                                print('Number of pgns in file is not correct', i, gamesNumber)
+                                raise Exception('Number of pgns in file is not correct')
+                            operation.update(100 + int(i * 100 / gamesNumber))
+                        else:
+                            break
+                    if i != gamesNumber:
+                        raise Exception('Number of pgns in file is not correct')
+                    self.filteredPgnGames = gamesList
+                    self.gamesSummary.build(self.filteredPgnGames)
+                    self.nodeTables.countResults(self.gamesSummary.results)
+
+                    self.buildReferences()
+                    return True
+
+        except:
+            os.remove(self.combinedFilename)
+            self.journal.clear()
+            self.clear('loadCombinedPgn')
+            return False
+
+    # sorts combined pgn according number of games in each node
+    def sortCombinedPgn(self, node: int, number_evaluated: int, update_function: callable) -> int:
+        self.combinedTree.sortChildren(node, lambda x: -self.getNodeGamesNumber(x))
+        n: int = number_evaluated
+        # run recursion
+        variation: int
+        for variation in self.combinedTree.children(node):
+            n = self.sortCombinedPgn(variation, n, update_function)
+        update_function(n + 1)
+        return n + 1
+
+    ## writes combined game and filtered games to pgn file
+    def writeCombinedPgn(self, filename: str) -> None:
+        with self.startOperation('Save combined pgn', 2 * len(self.filteredPgnGames)) as operation:
+            with open(filename, encoding='utf-8', mode='w') as file:
+                i: int = 0
+                # positions tree is converted to game with node tables in comments only for the export
+                combinedGame: chess.pgn.Game = self.combinedTree.toGame(
+                    lambda node: self.nodeTables.nodeComment(self.combinedTree, node, len(self.filteredPgnGames)))
+                combinedGame.headers[self.color] = self.player
+                print(combinedGame, file=file, end="\n\n")
+                i += len(self.filteredPgnGames)
+                operation.update(i)
+                entry: GameEntry
+                for entry in self.filteredPgnGames:
+                    print(entry.toGame(), file=file, end="\n\n")
+                    operation.update(i)
+                    i += 1
+
+    ## saves combined game to sqlite store, once store is written only evaluations are updated (in place)
+    def saveCombinedStore(self) -> bool:
+        try:
+            if self.combinedStore is None:
+                with self.startOperation('Save combined store', 1) as operation:
+                    self.combinedStore = CombinedStore(self.combinedFilename,
+                                                       self.config.getint('engine', 'analyzedMovesToSave'))
+                    self.combinedStore.save(self.combinedTree, self.nodeTables, self.filteredPgnGames, self.player,
+                                            self.color, self.totalNumberOfNodes)
+                    operation.update(1)
+            else:
+                self.combinedStore.commit()
+            return True
+        except:
+            traceback.print_exc()
+            self.showError('Unable to save game to {}'.format(self.combinedFilename))
+            try:
+                if self.combinedStore is not None:
+                    self.combinedStore.close()
+                self.combinedStore = None
+                os.remove(self.combinedFilename)
+            except:
+                pass
+            return False
+
+    ## saves combine pgn
+    def saveCombinedPgn(self) -> bool:
+        if self.isCombinedStore():
+            return self.saveCombinedStore()
+        try:
+            self.writeCombinedPgn(self.combinedFilename)
+            # all evaluations are folded into the pgn now
+            self.journal.clear()
+            return True
+        except:
+            self.showError('Unable to save game to {}'.format(self.combinedFilename))
+            try:
+                os.remove(self.combinedFilename)
+                self.journal.clear()
+            except:
+                pass
+            return False
+
+    ## exports combined game to pgn file (combined pgn format), combined game may be kept in any format
+    def exportCombinedPgn(self, filename: str) -> bool:
+        if self.combinedTree is None:
+            return False
+        try:
+            self.writeCombinedPgn(filename)
+            return True
+        except:
+            traceback.print_exc()
+            self.showError('Unable to export combined pgn to {}'.format(filename))
+            return False
+
+    ## folds journal into combined pgn
+    def compactCombinedPgn(self) -> None:
+        if self.combinedTree is None:
+            return
+        self.saveCombinedPgn()
+        # saving hides progress of running analysis
+        if self.analysisState is not None:
+            self.analysisOperation.update(self.analysisState.evaluated)
+
+    ## Builds combined pgn from all games
+    def buildCombinedPgn(self) -> bool:
+        self.clear('buildCombinedPgn')
+        extension: str = COMBINED_STORE_EXTENSION if self.config.get('combined', 'format') == 'sqlite' else '.pgn'
+        self.combinedFilename = '{}_{}_{}_{}{}{}'.format(self.filename.split('.')[0],
+                                                         self.fromDate.strftime('%Y_%m_%d'),
+                                                         self.tillDate.strftime('%Y_%m_%d'),
+                                                         self.color,
+                                                         self.filterSuffix(),
+                                                         extension)
+        if os.path.exists(self.combinedFilename):
+            if self.loadCombinedPgn():
+                return True
+
+        # build
+        if not self.isCombinedStore():
+            self.journal = EvaluationJournal(self.journalFilename(),
+                                             self.config.getint('engine', 'analyzedMovesToSave'))
+        with self.startOperation('Read games', len(self.filteredPgnGames)) as operation:
+            readGames(self.filename, self.filteredPgnGames, operation.update)
+        with self.startOperation('Build combined pgn', len(self.filteredPgnGames)) as operation:
+            self.combinedTree = PositionTree()
+            self.boardCache = BoardCache(self.combinedTree)
+            self.currentNode = ROOT
+            i: int = 0
+
+            keyCache: Dict[int, int] = {}
+            for entry in self.filteredPgnGames:
+                tmpKeyCache: Dict[int, int] = {}
+                self.addNode(ROOT, entry.mainlineMoves(), i, entry.board(), keyCache, tmpKeyCache)
+                keyCache.update(tmpKeyCache)
+                i += 1
+                operation.update(i)
+            self.totalNumberOfNodes = self.calcNodesNumber()
+            self.classifyEcoNodes()
+            self.nodeTables.countResults(self.gamesSummary.results)
+
+        with self.startOperation('Sort combined pgn', self.totalNumberOfNodes) as operation:
+            self.sortCombinedPgn(ROOT,
+                                 0,
+                                 operation.update)
+
+        # save
+        if not (self.saveCombinedPgn()):
+            self.clear('buildCombinedPgn')
+            return False
+        return True
+
+    ################################################### Pgn loading ####################################################
+    ## loads all the games of pgn file, player is the most frequent player in the file
+    def loadPgn(self) -> bool:
+        if self.filename is None:
+            self.showError('File is not set')
+            return False
+
+        try:
+            self.clear('loadPgnFile')
+            playersDictionary = {}
+            # games are taken from the index (pgn is scanned if there is no valid index), moves are parsed when
+            # combined pgn is built
+            with self.startOperation('Loading Pgn', os.path.getsize(self.filename)) as operation:
+                entries: List[GameEntry] = loadGameEntries(self.filename, self.config.getint('pgn', 'loadProcesses'),
+                                                           operation.update)
+                for entry in entries:
+                    addGame = entry.headers[COLORS[0]] != '?'
+                    if 'Variant' in entry.headers:
+                        if entry.headers['Variant'] != '?' and entry.headers['Variant'] != 'Standard':
+                            addGame = False
+                    if addGame:
+                        self.pgnAllGames.append(entry)
+                        for color in COLORS:
+                            if not (entry.headers[color] in playersDictionary):
+                                playersDictionary[entry.headers[color]] = 0
+                            playersDictionary[entry.headers[color]] += 1
+
+                if len(self.pgnAllGames) == 0:
+                    self.showError('No games')
+                    return False
+                self.gamesFilter.build(self.pgnAllGames)
+
+                self.player = max(playersDictionary.keys(), key=(lambda k: playersDictionary[k]))
+                return True
+
+        except:
+            traceback.print_exc()
+            self.showError('Error in loading pgn')
+            return False
+
+    ## filters games of the player played by the color between the dates, optionally by opponent elo range and time
+    ## control. Games are taken from the games filter index in pgn order
+    def filterGames(self, fromDate: date, tillDate: date, color: str, minElo: Optional[int] = None,
+                    maxElo: Optional[int] = None, timeControl: str = ANY_TIME_CONTROL) -> None:
+        self.clear('refreshPerod')
+        self.fromDate = fromDate
+        self.tillDate = tillDate
+        self.color = color
+        self.minElo = minElo
+        self.maxElo = maxElo
+        self.timeControl = timeControl
+        for gameId in self.gamesFilter.filter(self.player, self.color, self.fromDate, self.tillDate, self.minElo,
+                                              self.maxElo, self.timeControl):
+            self.filteredPgnGames.append(self.pgnAllGames[gameId])
+        self.gamesSummary.build(self.filteredPgnGames)
+
+    ## returns suffix of combined filename for filter by opponent elo and time control, empty if they are not set
+    def filterSuffix(self) -> str:
+        suffix: str = ''
+        if self.timeControl != ANY_TIME_CONTROL:
+            suffix += '-' + self.timeControl
+        if self.minElo is not None or self.maxElo is not None:
+            suffix += '-{}-{}'.format(self.minElo if self.minElo is not None else '',
+                                      self.maxElo if self.maxElo is not None else '')
+        return suffix
+
+    ## parses suffix of combined filename made by filterSuffix, returns (min elo, max elo, time control). Raises
+    ## ValueError if suffix is not correct
+    @staticmethod
+    def parseFilterSuffix(suffix: str) -> Tuple[Optional[int], Optional[int], str]:
+        parts: List[str] = suffix.split('-')[1:] if suffix != '' else []
+        timeControl: str = ANY_TIME_CONTROL
+        # time control is alone part before two parts of elo limits
+        if len(parts) % 2 == 1:
+            timeControl = parts.pop(0)
+            if timeControl == ANY_TIME_CONTROL or timeControl not in TIME_CONTROLS:
+                raise ValueError('Unknown time control {}'.format(timeControl))
+        if len(parts) == 0:
+            return None, None, timeControl
+        if len(parts) != 2 or parts == ['', '']:
+            raise ValueError('Incorrect elo limits {}'.format(suffix))
+        return (int(parts[0]) if parts[0] != '' else None), (int(parts[1]) if parts[1] != '' else None), timeControl
+
+    ############################################## Mistakes table ######################################################
+    ## checks specific node, uppends it to the list if it is a mistake
+    def checkNodeToBeMistake(self, node: int, half_move: int, ignoreScore: float, changeScore: float,
+                             nodesDict: Dict[int, int]) -> None:
+        # check that it is move of correct color
+        if (self.color == WHITE) and (half_move % 2 == 0):
+            return
+        if (self.color == BLACK) and (half_move % 2 == 1):
+            return
+        if node in nodesDict:
+            return
+
+        evalStats = self.nodeTables.getEvaluation(node)
+
+        # if not analysed already
+        if evalStats is None:
+            return
+
+        # change score
+        if self.color == WHITE and evalStats.change > -changeScore:
+            return
+        if self.color == BLACK and evalStats.change < changeScore:
+            return
+
+        # ignore score
+        parentEval = evalStats.score - evalStats.change
+        if abs(evalStats.score) > ignoreScore and abs(parentEval) > ignoreScore:
+            return
+
+        nodesDict[node] = half_move
+
+    ## Builds mistakes table: mistakes of the player in first moves, sorted by criteria ('Move #', 'Eval' or 'Change')
+    def buildMistakesTable(self, stat_moves: int, ignore_score: float, min_change: float,
+                           sortingCriteria: str) -> List[List[Union[int, str]]]:
+        if self.color == WHITE:
+            sorting_to_lambda: Dict[str, callable] = {'Move #': lambda x: x[0],
+                                                      'Eval': lambda x: -float(x[3]),
+                                                      'Change': lambda x: float(x[4])
+                                                      }
+        else:
+            sorting_to_lambda: Dict[str, callable] = {'Move #': lambda x: x[0],
+                                                      'Eval': lambda x: float(x[3]),
+                                                      'Change': lambda x: -float(x[4])
+                                                      }
+
+        sorting_lambda: callable = sorting_to_lambda[sortingCriteria]
+
+        if self.color == WHITE:
+            half_moves = stat_moves * 2 - 1
+        else:
+            half_moves = stat_moves
+        nodesDict: Dict[int, int] = {}
+
+        self.scanNodesToDepth(ROOT,
+                              0,
+                              half_moves,
+                              lambda x, half_move: self.checkNodeToBeMistake(x,
+                                                                             half_move,
+                                                                             ignore_score,
+                                                                             min_change,
+                                                                             nodesDict))
+        self.mistakesTableInfo.clear()
+        mistakes_table: List[List[(int, str, EcoInfoWithNode)]] = []
+        for node in nodesDict:
+            evalStats: EvaluationStats = self.nodeTables.getEvaluation(node)
+            assert (evalStats is not None)
+            eco_info_node: Optional[EcoInfoWithNode] = self.getNodeEcoEntry(node)
+            if eco_info_node is None:
+                eco_info_node = EcoInfoWithNode(UNKNOWN_ECO_INFO, node)
+            # here we need original node and not eco node
+            eco_info_node.node = node
+            # move which should be played instead of the mistake
+            parent: int = self.combinedTree.parents[node]
+            parentEvalStats: EvaluationStats = self.nodeTables.getEvaluation(parent)
+            entry = [int((nodesDict[node] + 1) / 2),
+                     eco_info_node.ecoInfo.shortName(),
+                     self.combinedTree.sans[node],
+                     evalStats.scoreStr(),
+                     evalStats.changeStr(),
+                     parentEvalStats.bestMoveSan(self.boardCache.board(parent)) if parentEvalStats is not None else '',
+                     evalStats.depthStr(),
+                     eco_info_node]
+            mistakes_table.append(entry)
+
+        mistakes_table.sort(key=sorting_lambda)
+        for entry in mistakes_table:
+            eco_info_node = entry.pop(-1)
+            self.mistakesTableInfo.append(eco_info_node)
+        return mistakes_table
+
+    ############################################### Bad results table ##################################################
+    ## checks specific node, uppends it to the list if it can be in bad_results list
+    @staticmethod
+    def checkNodeToBeInBadResultTable(node, half_move, max_half_move, nodesList):
+        if half_move == max_half_move and (node not in nodesList):
+            nodesList.append(node)
+
+    ## builds bad results table: variants after first moves with bad results of the player, sorted by criteria ('Games'
+    ## or 'Losts %')
+    def buildBadResultsTable(self, moves: int, sortingCriteria: str) -> List[List[Union[int, str]]]:
+        sorting_to_lambda: Dict[str, callable] = {'Games': lambda x: -x[1],
+                                                  'Losts %': lambda x: -float(x[3] / x[1]),
+                                                  }
+        sorting_lambda = sorting_to_lambda[sortingCriteria]
+        if self.color == WHITE:
+            half_moves: int = moves * 2 - 1
+        else:
+            half_moves: int = moves
+        nodes_list: List[int] = []
+        # Get all nodes
+        self.scanNodesToDepth(ROOT,
+                              0,
+                              half_moves,
+                              lambda x, half_move: self.checkNodeToBeInBadResultTable(x,
+                                                                                      half_move,
+                                                                                      half_moves,
+                                                                                      nodes_list))
+        # unify all nodes with same eco
+        ecoInfoToGamesStats: Dict[EcoInfo, List[Union[GameStats, EcoInfoWithNode, List[int]]]] = {}
+        for node in nodes_list:
+            ecoInfoWithNode: Optional[EcoInfoWithNode] = self.getNodeEcoEntry(node)
+            if ecoInfoWithNode is None:
+                ecoInfoWithNode = EcoInfoWithNode(UNKNOWN_ECO_INFO, node)
+            if ecoInfoWithNode.ecoInfo not in ecoInfoToGamesStats:
+                ecoInfoToGamesStats[ecoInfoWithNode.ecoInfo] = [self.getNodeResults(node), ecoInfoWithNode, [node]]
+            else:
+                ecoInfoToGamesStats[ecoInfoWithNode.ecoInfo][0] += self.getNodeResults(node)
+                ecoInfoToGamesStats[ecoInfoWithNode.ecoInfo][2].append(node)
+
+        badGamesTable = []
+        self.badGamesTableInfo.clear()
+        minLostRatio = self.config.getfloat('badResultsTable', 'minLostRatio')
+
+        # now fill the table
+        for ecoInfo in ecoInfoToGamesStats:
+            gamesStats: GameStats = ecoInfoToGamesStats[ecoInfo][0]
+
+            if self.color == WHITE:
+                wins: int = gamesStats.white
+                losts: int = gamesStats.black
+            else:
+                wins: int = gamesStats.black
+                losts: int = gamesStats.white
+
+            if gamesStats.getLostAndDrawsRatio(self.color) > minLostRatio:
+                badGamesTable.append([ecoInfo.shortName(),
+                                      gamesStats.totalGames,
+                                      wins,
+                                      losts,
+                                      gamesStats.draws,
+                                      ecoInfoToGamesStats[ecoInfo][1],
+                                      ecoInfoToGamesStats[ecoInfo][2]])
+        badGamesTable.sort(key=sorting_lambda)
+        for entry in badGamesTable:
+            entry_list: List[int] = entry.pop(-1)
+            entryEcoInfoWithNode: EcoInfoWithNode = entry.pop(-1)
+            self.badGamesTableInfo.append([entryEcoInfoWithNode, entry_list])
+        return badGamesTable
+
+    ################################################ Analysis ##########################################################
+    ## returns color of side which made the move of the node
+    def moveColor(self, node: int) -> bool:
+        return self.combinedTree.moveColor(node)
+
+    ## sets node evaluation (instead of previous one if exists) and writes it to journal (or to sqlite store in place)
+    def writeNodeEvaluation(self, node: int, evalStats: EvaluationStats) -> None:
+        self.nodeTables.setEvaluation(node, evalStats)
+        if self.combinedStore is not None:
+            self.combinedStore.setEvaluation(node, evalStats)
+            return
+        self.journal.append(self.combinedTree.path(node), evalStats.score, evalStats.change, evalStats.bestMove,
+                            evalStats.depth)
+
+    ## updates node with engine score, calculates change relatively to parent
+    def setNodeEvaluation(self, node: int, score: float, bestMove: Optional[str],
+                          depth: int) -> EvaluationStats:
+        # calculate change
+        if node != ROOT:
+            parentEvalStats: Optional[EvaluationStats] = self.nodeTables.getEvaluation(
+                self.combinedTree.parents[node])
+            assert (parentEvalStats is not None)
+            scoreChange = score - parentEvalStats.score
+        else:
+            scoreChange = 0.0
+        # update node with data
+        evalStats = EvaluationStats(score, scoreChange, bestMove, depth)
+        self.writeNodeEvaluation(node, evalStats)
+        return evalStats
+
+    ## classifies evaluated node and shows its classification
+    def onNodeEvaluated(self, node: int, evalStats: EvaluationStats, reevaluated: bool = False) -> None:
+        move_classification = self.classifyMove(evalStats.change, self.moveColor(node))
+        with self.lock:
+            if reevaluated:
+                if node in self.mistakeNodes:
+                    self.mistakeNodes.remove(node)
+                if node in self.unaccuracyNodes:
+                    self.unaccuracyNodes.remove(node)
+            if move_classification == MISTAKE:
+                self.mistakeNodes.append(node)
+            if move_classification == UNACCURACY:
+                self.unaccuracyNodes.append(node)
+            self.showNodeClassification(node, move_classification)
+
+    ## shows classification of evaluated node (analysis tree coloring)
+    def showNodeClassification(self, node: int, move_classification: str) -> None:
+        pass
+
+    ## sets node score, if parent is not evaluated yet the node waits for it. Returns list of evaluated nodes
+    def setNodeScore(self, state: AnalysisState, node: int, score: float, bestMove: Optional[str],
+                     depth: int) -> List[int]:
+        parent: int = self.combinedTree.parents[node]
+        if node != ROOT and self.nodeTables.getEvaluation(parent) is None:
+            state.waitingForParent.setdefault(parent, []).append([node, score, bestMove, depth])
+            return []
+
+        evaluatedNodes: List[int] = []
+        readyList: List[List[Union[int, float, Optional[str], int]]] = [[node, score, bestMove, depth]]
+        while len(readyList) > 0:
+            node, score, bestMove, depth = readyList.pop()
+            evalStats = self.setNodeEvaluation(node, score, bestMove, depth)
+            readyList += state.waitingForParent.pop(node, [])
+            evaluatedNodes.append(node)
+            try:
+                self.onNodeEvaluated(node, evalStats)
+            except:
+                pass
+        state.evaluated += len(evaluatedNodes)
+        return evaluatedNodes
+
+    ## sets deeper search score of evaluated node, changes of the node and its children are recalculated
+    def rescoreNode(self, state: AnalysisState, node: int, score: float, bestMove: Optional[str],
+                    depth: int) -> None:
+        changedNodes: List[List[Union[int, EvaluationStats]]] = []
+        scoreChange: float = 0.0
+        if node != ROOT:
+            scoreChange = score - self.nodeTables.getEvaluation(self.combinedTree.parents[node]).score
+        changedNodes.append([node, EvaluationStats(score, scoreChange, bestMove, depth)])
+        for variation in self.combinedTree.children(node):
+            variationEvalStats: Optional[EvaluationStats] = self.nodeTables.getEvaluation(variation)
+            if not self.combinedTree.isTransposition(variation) and variationEvalStats is not None:
+                variationEvalStats.change = variationEvalStats.score - score
+                changedNodes.append([variation, variationEvalStats])
+
+        for changedNode, evalStats in changedNodes:
+            self.writeNodeEvaluation(changedNode, evalStats)
+            try:
+                self.onNodeEvaluated(changedNode, evalStats, True)
+            except:
+                pass
+        state.evaluated += 1
+
+    ## returns children waited for the search of evaluated nodes, together with lines of the search
+    @staticmethod
+    def popWaitingChildren(state: AnalysisState,
+                           evaluatedNodes: List[int]) -> List[List[Union[int,
+                                                                                        AnalysisLines]]]:
+        children: List[List[Union[int, AnalysisLines]]] = []
+        for node in evaluatedNodes:
+            lines: AnalysisLines = state.nodeToLines.pop(node, {})
+            children += [[child, lines] for child in state.waitingForLines.pop(node, [])]
+        return children
+
+    ## returns node position evaluation from evaluations store, otherwise sends position to the engines (once for all
+    ## the nodes with the position: transpositions or different move counters) and returns None
+    def requestNodePosition(self, state: AnalysisState,
+                            node: int) -> Optional[Tuple[float, Optional[str], int]]:
+        chessBoard = self.boardCache.board(node)
+        positionKeyValue: int = positionKey(chessBoard)
+        if positionKeyValue in state.positionKeyToNodes:
+            state.positionKeyToNodes[positionKeyValue].append(node)
+            state.transposedNodes += 1
+            return None
+
+        # check if position was already analyzed in another combined pgn
+        stored: Optional[Tuple[float, Optional[str], int]] = self.evaluationStore.get(positionKeyValue, state.depth)
+        if stored is None:
+            state.positionKeyToNodes[positionKeyValue] = [node]
+            if state.pool is None:
+                state.pool = self.startAnalysisPool()
+            state.pool.submit(AnalysisRequest(positionKeyValue, chessBoard, state.depth, state.multiPV))
+        return stored
+
+    ## takes nodes score from parent MultiPV lines or from evaluations store, otherwise sends nodes to the engines
+    def scheduleNodes(self, state: AnalysisState,
+                      workList: List[List[Union[int, AnalysisLines]]]) -> None:
+        while len(workList) > 0:
+            node, lines = workList.pop(0)
+            evaluatedNodes: List[int] = []
+            move: Optional[chess.Move] = self.combinedTree.move(node)
+            if move in lines:
+                # parent search already scored the move, it is search of the depth less by one
+                score, bestReply = lines[move]
+                evaluatedNodes = self.setNodeScore(state, node, score,
+                                                   bestReply.uci() if bestReply is not None else None,
+                                                   state.depth - 1)
+                state.savedEngineCalls += 1
+            else:
+                stored: Optional[Tuple[float, Optional[str], int]] = self.requestNodePosition(state, node)
+                if stored is not None:
+                    evaluatedNodes = self.setNodeScore(state, node, stored[0], stored[1], stored[2])
+
+            workList += self.popWaitingChildren(state, evaluatedNodes)
+
+    ## first pass result: score goes to all the nodes with the position, every node change is calculated against own
+    ## parent (so node may wait for the parent score). Children waiting for the search of evaluated nodes can be
+    ## scheduled now
+    def onAnalysisResult(self, state: AnalysisState, result: AnalysisResult, nodes: List[int]) -> None:
+        bestMove: Optional[str] = result.bestMove.uci() if result.bestMove is not None else None
+        evaluatedNodes: List[int] = []
+        for node in nodes:
+            if state.multiPV > 1:
+                state.nodeToLines[node] = result.lines
+            evaluatedNodes += self.setNodeScore(state, node, result.score, bestMove, result.depth)
+        self.scheduleNodes(state, self.popWaitingChildren(state, evaluatedNodes))
+
+    ## deep analysis result: rescores all the nodes with the position
+    def onDeepAnalysisResult(self, state: AnalysisState, result: AnalysisResult,
+                             nodes: List[int]) -> None:
+        bestMove: Optional[str] = result.bestMove.uci() if result.bestMove is not None else None
+        for node in nodes:
+            self.rescoreNode(state, node, result.score, bestMove, result.depth)
+
+    ## selects nodes for deep analysis: nodes with shallow change close to unaccuracy or worse and their parents
+    def selectNodesForDeepAnalysis(self, nodesList: List[int], depth: int) -> List[int]:
+        threshold: float = self.config.getfloat('moves_classification', 'unaccuracyMoveChange') - \
+            self.config.getfloat('engine', 'adaptiveDepthMargin')
+        selected: Dict[int, int] = {}
+        nodeIndex: int
+        for nodeIndex in range(len(nodesList)):
+            node = nodesList[nodeIndex]
+            evalStats: Optional[EvaluationStats] = self.nodeTables.getEvaluation(node)
+            if node == ROOT or evalStats is None:
+                continue
+            moveColor = self.moveColor(node)
+            if (moveColor == chess.WHITE and evalStats.change < -threshold) or \
+                    (moveColor == chess.BLACK and evalStats.change > threshold):
+                for candidate in [self.combinedTree.parents[node], node]:
+                    candidateEvalStats: EvaluationStats = self.nodeTables.getEvaluation(candidate)
+                    if candidateEvalStats.depth < depth:
+                        selected[candidate] = nodeIndex
+        # parents are analyzed before children
+        return sorted(selected.keys(), key=lambda x: selected[x])
+
+    ## starts analysis - sends combined game nodes to engines pool (every position once), results are processed by
+    ## processAnalysisResults. Nodes are sent in BFS order or most played first (analysisOrder = bfs/games). In two
+    ## phases mode first pass is shallow and only possible mistakes are analyzed by full depth later
+    def startAnalysis(self) -> None:
+        print('Analysis started')
+        if self.config.get('engine', 'analysisOrder') == 'games':
+            self.analysisNodesList = self.buildPriorityNodesList()
+        else:
+            self.analysisNodesList = self.buildBFSNodesList()
+        shallowDepth: int = self.config.getint('engine', 'shallowDepth')
+        multiPV: int = self.config.getint('engine', 'multiPV')
+        # engines are not started if all the positions are already evaluated
+        state = AnalysisState(None, shallowDepth if shallowDepth > 0 else self.config.getint('engine', 'depth'),
+                              multiPV)
+        self.analysisState = state
+        self.analysisOperation = self.startOperation('Analyze', len(self.analysisNodesList)).__enter__()
+        nodesToSchedule: List[int] = []
+        for node in self.analysisNodesList:
+            # check if staticstics already updated
+            evalStats: Optional[EvaluationStats] = self.nodeTables.getEvaluation(node)
+            if evalStats is not None:
+                self.onNodeEvaluated(node, evalStats)
+                state.evaluated += 1
+            elif multiPV > 1 and node != ROOT and \
+                    self.nodeTables.getEvaluation(self.combinedTree.parents[node]) is None:
+                # in MultiPV mode node waits for the parent search, it may score the node
+                state.waitingForLines.setdefault(self.combinedTree.parents[node], []).append(node)
+            else:
+                nodesToSchedule.append(node)
+        self.scheduleNodes(state, [[node, {}] for node in nodesToSchedule])
+        self.analysisOperation.update(state.evaluated)
+        self.checkAnalysisPassFinished()
+
+    ## starts engines (or server of workers) analyzing positions
+    def startAnalysisPool(self) -> Union[EnginePool, AnalysisServer]:
+        if self.config.getint('analysisServer', 'port') > 0:
+            # positions are analyzed by workers connected to the server
+            return AnalysisServer(self.config.get('analysisServer', 'host'),
+                                  self.config.getint('analysisServer', 'port'),
+                                  self.config.getfloat('analysisServer', 'leaseTimeout'))
+        return EnginePool(self.config.get('engine', 'enginePath'), self.config.getint('engine', 'workers'))
+
+    ## processes engine results which came till timeout. Called periodically while analysis is running (from window
+    ## events loop), results are processed during ANALYSIS_PROCESSING_TIME at most, so caller stays responsive
+    def processAnalysisResults(self, timeout: float) -> None:
+        state: Optional[AnalysisState] = self.analysisState
+        if state is None:
+            return
+        result: Optional[AnalysisResult] = state.pool.getResult(timeout)
+        if result is None and not state.pool.isAlive():
+            print('Engines are not running, analysis is stopped')
+            self.stopAnalysis()
+            return
+        deadline: float = time.monotonic() + ANALYSIS_PROCESSING_TIME
+        while result is not None:
+            self.evaluationStore.put(result.key, result.depth, result.score,
+                                     result.bestMove.uci() if result.bestMove is not None else None)
+            nodes: List[int] = state.positionKeyToNodes.pop(result.key)
+            if state.deep:
+                self.onDeepAnalysisResult(state, result, nodes)
+            else:
+                self.onAnalysisResult(state, result, nodes)
+            if time.monotonic() > deadline:
+                break
+            result = state.pool.getResult(0)
+        self.analysisOperation.update(state.evaluated)
+        self.checkAnalysisPassFinished()
+
+    ## when all the positions of the pass are analyzed starts deep analysis pass or finishes analysis
+    def checkAnalysisPassFinished(self) -> None:
+        state: AnalysisState = self.analysisState
+        if len(state.positionKeyToNodes) > 0:
+            return
+        if not state.deep:
+            if state.multiPV > 1:
+                print('MultiPV analysis: {} engine calls saved'.format(state.savedEngineCalls))
+            print('{} nodes got score of same position searched for another node'.format(state.transposedNodes))
+
+            # deep analysis of possible mistakes
+            if self.config.getint('engine', 'shallowDepth') > 0:
+                depth: int = self.config.getint('engine', 'depth')
+                deepNodes: List[int] = self.selectNodesForDeepAnalysis(self.analysisNodesList, depth)
+                print('{} of {} nodes are analyzed by full depth'.format(len(deepNodes), len(self.analysisNodesList)))
+                self.analysisOperation.__exit__(None, None, None)
+                state = AnalysisState(state.pool, depth, 1, True)
+                self.analysisState = state
+                self.analysisOperation = self.startOperation('Deep analysis', len(deepNodes)).__enter__()
+                for node in deepNodes:
+                    stored: Optional[Tuple[float, Optional[str], int]] = self.requestNodePosition(state, node)
+                    if stored is not None:
+                        self.rescoreNode(state, node, stored[0], stored[1], stored[2])
+                self.analysisOperation.update(state.evaluated)
+                if len(state.positionKeyToNodes) > 0:
+                    return
+        self.stopAnalysis()
+
+    ## stops running analysis immediately (searches in flight are cancelled) and folds journal into combined pgn
+    def stopAnalysis(self) -> None:
+        if self.analysisState is None:
+            return
+        if self.analysisState.pool is not None:
+            self.analysisState.pool.stop()
+        self.analysisOperation.__exit__(None, None, None)
+        self.analysisState = None
+        self.analysisOperation = None
+        self.analysisNodesList = []
+        self.evaluationStore.close()
+        # fold journal into combined pgn
+        try:
+            self.saveCombinedPgn()
+        except:
+            pass
+        print('Analysis EXIT')
@@ -0,0 +1,264 @@
+from typing import Deque, Dict, List, Optional, Set
+import chess
+import asyncio
+import collections
+import json
+import queue
+import threading
+import time
+import traceback
+from enginePool import AnalysisLines, AnalysisRequest, AnalysisResult
+
+LEASES_CHECK_INTERVAL = 1.0  # seconds between checks of expired leases
+
+
+# Protocol between server and workers: every message is json object in single line.
+#   worker -> server: {"type": "hello", "worker": <name>, "capacity": <number of engines>,
+#                      "inFlight": [<keys of positions searched or not sent from previous connection>, ...]}
+#   server -> worker: {"type": "request", "key": <position key>, "fen": <fen>, "depth": <depth>, "multiPV": <lines>}
+#   worker -> server: {"type": "result", "key": <position key>, "depth": <depth>, "score": <score>,
+#                      "bestMove": <uci or null>, "lines": [[<uci>, <score>, <reply uci or null>], ...]}
+
+
+## converts analysis request to protocol message
+def requestToMessage(request: AnalysisRequest) -> dict:
+    return {'type': 'request', 'key': request.key, 'fen': request.board.fen(), 'depth': request.depth,
+            'multiPV': request.multiPV}
+
+
+## converts protocol message to analysis request
+def messageToRequest(message: dict) -> AnalysisRequest:
+    return AnalysisRequest(message['key'], chess.Board(message['fen']), message['depth'], message['multiPV'])
+
+
+## converts analysis result to protocol message
+def resultToMessage(result: AnalysisResult) -> dict:
+    return {'type': 'result', 'key': result.key, 'depth': result.depth, 'score': result.score,
+            'bestMove': result.bestMove.uci() if result.bestMove is not None else None,
+            'lines': [[move.uci(), score, reply.uci() if reply is not None else None]
+                      for move, (score, reply) in result.lines.items()]}
+
+
+## converts protocol message to analysis result
+def messageToResult(message: dict) -> AnalysisResult:
+    lines: AnalysisLines = {}
+    for move, score, reply in message['lines']:
+        lines[chess.Move.from_uci(move)] = (score, chess.Move.from_uci(reply) if reply is not None else None)
+    return AnalysisResult(message['key'], message['depth'], message['score'],
+                          chess.Move.from_uci(message['bestMove']) if message['bestMove'] is not None else None,
+                          lines)
+
+
+## encodes protocol message
+def encodeMessage(message: dict) -> bytes:
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+## class describes connected worker
+class WorkerConnection:
+    name: str  # worker name
+    capacity: int  # number of positions worker analyzes simultaneously
+    writer: asyncio.StreamWriter  # connection to worker
+    leased: Set[int]  # keys of positions leased to the worker
+    unleased: Set[int]  # keys of positions worker searches without lease (lease expired, other worker answered first
+    # or position came by previous connection), they take worker capacity till worker answers
+
+    def __init__(self, name: str, capacity: int, writer: asyncio.StreamWriter, inFlight: List[int]) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.writer = writer
+        self.leased = set()
+        self.unleased = set(inFlight)
+
+    ## returns True if worker can take one more position
+    def hasFreeCapacity(self) -> bool:
+        return len(self.leased) + len(self.unleased) < self.capacity
+
+
+## Work queue server - hands out positions to workers connected by socket and collects their results. Has same
+## interface as EnginePool, so analysis does not care who analyzes positions. Position leased to worker which
+## disconnected or did not answer during lease timeout is handed out again to another worker, first result of position
+## wins. Worker which did not answer keeps searching the position, so it takes worker capacity till worker answers
+class AnalysisServer:
+    host: str  # address server listens on
+    port: int  # port server listens on
+    leaseTimeout: float  # seconds worker has to analyze position before it is handed out again
+    loop: asyncio.AbstractEventLoop  # event loop of server
+    thread: threading.Thread  # thread runs event loop
+    server: Optional[asyncio.AbstractServer]  # listening server
+    leasesTask: Optional[asyncio.Task]  # task reassigns expired leases
+    resultsQueue: queue.Queue  # analyzed positions
+    pending: Dict[int, AnalysisRequest]  # submitted positions which were not analyzed yet
+    waiting: Deque[int]  # keys of positions waiting to be leased (may contain already analyzed positions)
+    leases: Dict[int, List]  # position key -> [worker, lease time]
+    workers: List[WorkerConnection]  # connected workers
+    running: bool  # False after server was stopped or failed to start
+
+    def __init__(self, host: str, port: int, leaseTimeout: float) -> None:
+        self.host = host
+        self.port = port
+        self.leaseTimeout = leaseTimeout
+        self.resultsQueue = queue.Queue()
+        self.server = None
+        self.leasesTask = None
+        self.pending = {}
+        self.waiting = collections.deque()
+        self.leases = {}
+        self.workers = []
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.loopThread, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+
+    ## puts position to the work queue
+    def submit(self, request: AnalysisRequest) -> None:
+        self.loop.call_soon_threadsafe(self.enqueue, request)
+
+    ## returns next analyzed position or None if nothing came till timeout
+    def getResult(self, timeout: Optional[float] = None) -> Optional[AnalysisResult]:
+        try:
+            if timeout == 0:
+                return self.resultsQueue.get_nowait()
+            return self.resultsQueue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    ## returns True while server is running (workers may come and go)
+    def isAlive(self) -> bool:
+        return self.running
+
+    ## stops server and disconnects workers
+    def stop(self) -> None:
+        if not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    ## closes listening server and workers connections
+    async def close(self) -> None:
+        self.running = False
+        if self.server is not None:
+            self.server.close()
+        if self.leasesTask is not None:
+            self.leasesTask.cancel()
+            await asyncio.gather(self.leasesTask, return_exceptions=True)
+        for worker in self.workers:
+            worker.writer.close()
+
+    ## event loop thread
+    def loopThread(self, started: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.onConnection, self.host, self.port))
+            print('analysis server is listening on {}:{}'.format(self.host, self.port))
+            self.leasesTask = self.loop.create_task(self.checkLeases())
+        except:
+            traceback.print_exc()
+            self.running = False
+        started.set()
+        try:
+            if self.running:
+                self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    ## adds position to the work queue
+    def enqueue(self, request: AnalysisRequest) -> None:
+        self.pending[request.key] = request
+        self.waiting.append(request.key)
+        self.dispatch()
+
+    ## hands out waiting positions to workers which have free capacity. Position is not handed out to worker which
+    ## still searches it, such position waits for another worker or for the answer
+    def dispatch(self) -> None:
+        postponed: List[int] = []
+        while len(self.waiting) > 0 and any(worker.hasFreeCapacity() for worker in self.workers):
+            key: int = self.waiting.popleft()
+            # position was analyzed after it was put to the queue again
+            if key not in self.pending or key in self.leases:
+                continue
+            worker: Optional[WorkerConnection] = next((worker for worker in self.workers
+                                                      if worker.hasFreeCapacity() and key not in worker.unleased),
+                                                     None)
+            if worker is None:
+                postponed.append(key)
+                continue
+            self.leases[key] = [worker, time.monotonic()]
+            worker.leased.add(key)
+            worker.writer.write(encodeMessage(requestToMessage(self.pending[key])))
+        self.waiting.extendleft(reversed(postponed))
+
+    ## releases lease of position, worker still searches the position so it keeps taking worker capacity
+    def releaseLease(self, key: int) -> None:
+        lease: Optional[List] = self.leases.pop(key, None)
+        if lease is not None:
+            lease[0].leased.discard(key)
+            lease[0].unleased.add(key)
+
+    ## position came from worker: first result of position goes to results queue, others are ignored
+    def onResult(self, worker: WorkerConnection, result: AnalysisResult) -> None:
+        # worker finished the search, position does not take its capacity anymore
+        if result.key in worker.leased:
+            del self.leases[result.key]
+            worker.leased.discard(result.key)
+        worker.unleased.discard(result.key)
+        request: Optional[AnalysisRequest] = self.pending.get(result.key)
+        # position was already analyzed by another worker or it is result of previous shallower search
+        if request is not None and result.depth >= request.depth:
+            del self.pending[result.key]
+            self.releaseLease(result.key)
+            self.resultsQueue.put(result)
+        self.dispatch()
+
+    ## positions leased to the worker are handed out again
+    def reassignLeases(self, worker: WorkerConnection) -> None:
+        for key in list(worker.leased):
+            del self.leases[key]
+            self.waiting.appendleft(key)
+        worker.leased.clear()
+        worker.unleased.clear()
+
+    ## reassigns leases which were not answered during lease timeout
+    async def checkLeases(self) -> None:
+        while True:
+            await asyncio.sleep(LEASES_CHECK_INTERVAL)
+            now = time.monotonic()
+            for key, (worker, leaseTime) in list(self.leases.items()):
+                if now - leaseTime > self.leaseTimeout:
+                    print('lease of position {} by worker {} expired'.format(key, worker.name))
+                    self.releaseLease(key)
+                    self.waiting.appendleft(key)
+            self.dispatch()
+
+    ## worker connection - registers worker and reads its results till it disconnects
+    async def onConnection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        worker: Optional[WorkerConnection] = None
+        try:
+            hello = json.loads(await reader.readline())
+            worker = WorkerConnection(hello['worker'], max(hello['capacity'], 1), writer, hello['inFlight'])
+            self.workers.append(worker)
+            print('worker {} connected: capacity={}, positions in flight={}'.format(worker.name, worker.capacity,
+                                                                                   len(worker.unleased)))
+            self.dispatch()
+            while True:
+                line: bytes = await reader.readline()
+                if len(line) == 0:
+                    break
+                message = json.loads(line)
+                if message['type'] == 'result':
+                    self.onResult(worker, messageToResult(message))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except:
+            traceback.print_exc()
+        finally:
+            writer.close()
+            if worker is not None:
+                self.workers.remove(worker)
+                print('worker {} disconnected: {} positions are handed out again'.format(worker.name,
+                                                                                          len(worker.leased)))
+                self.reassignLeases(worker)
+                self.dispatch()
@@ -0,0 +1,106 @@
+from typing import List, Optional, Set
+import configparser
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from enginePool import EnginePool, AnalysisRequest, AnalysisResult
+from analysisServer import encodeMessage, messageToRequest, resultToMessage
+
+CONFIG_FILE = 'config.cfg'
+RESULT_WAIT_TIMEOUT = 0.5  # seconds worker waits for engine result before it checks the connection
+
+
+## Headless worker - analyzes positions handed out by analysis server with local engines. When connection drops the
+## worker reconnects, results which were not sent yet are sent after reconnection. Positions still searched are
+## reported to the server on reconnection, so they take worker capacity and are not handed out to the worker again
+class AnalysisWorker:
+    name: str  # worker name reported to server
+    host: str  # server address
+    port: int  # server port
+    capacity: int  # number of positions worker analyzes simultaneously
+    reconnectInterval: float  # seconds between connection attempts
+    pool: EnginePool  # local engines
+    unsent: List[AnalysisResult]  # results which were not sent to the server yet
+    searching: Set[int]  # keys of positions sent to the engines which did not return result yet
+
+    def __init__(self, config: configparser.RawConfigParser, host: str, port: int) -> None:
+        self.name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.host = host
+        self.port = port
+        self.capacity = max(config.getint('engine', 'workers'), 1)
+        self.reconnectInterval = config.getfloat('analysisServer', 'reconnectInterval')
+        self.pool = EnginePool(config.get('engine', 'enginePath'), self.capacity)
+        self.unsent = []
+        self.searching = set()
+
+    ## reads positions from the server and sends them to the engines till connection is closed
+    def readRequests(self, connection: socket.socket) -> None:
+        try:
+            with connection.makefile('rb') as file:
+                for line in file:
+                    request: AnalysisRequest = messageToRequest(json.loads(line))
+                    self.searching.add(request.key)
+                    self.pool.submit(request)
+        except OSError:
+            pass
+
+    ## sends engine results to the server till connection is closed
+    def sendResults(self, connection: socket.socket, reader: threading.Thread) -> None:
+        while reader.is_alive() and self.pool.isAlive():
+            result: Optional[AnalysisResult] = self.pool.getResult(RESULT_WAIT_TIMEOUT)
+            if result is not None:
+                self.unsent.append(result)
+                self.searching.discard(result.key)
+            while len(self.unsent) > 0:
+                connection.sendall(encodeMessage(resultToMessage(self.unsent[0])))
+                self.unsent.pop(0)
+
+    ## works with server till engines are running, reconnects when connection drops
+    def run(self) -> None:
+        while self.pool.isAlive():
+            connection: Optional[socket.socket] = None
+            try:
+                connection = socket.create_connection((self.host, self.port))
+                inFlight: List[int] = list(self.searching) + [result.key for result in self.unsent]
+                connection.sendall(encodeMessage({'type': 'hello', 'worker': self.name, 'capacity': self.capacity,
+                                                  'inFlight': inFlight}))
+                print('worker {} connected to {}:{}'.format(self.name, self.host, self.port))
+                reader = threading.Thread(target=self.readRequests, args=(connection,), daemon=True)
+                reader.start()
+                self.sendResults(connection, reader)
+            except OSError as error:
+                print('worker {}: connection to {}:{} failed: {}'.format(self.name, self.host, self.port, error))
+            except:
+                traceback.print_exc()
+            finally:
+                if connection is not None:
+                    try:
+                        connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    connection.close()
+            if self.pool.isAlive():
+                time.sleep(self.reconnectInterval)
+        self.pool.stop()
+        print('worker {} EXIT'.format(self.name))
+
+
+## runs worker: analysisWorker.py [server host] [server port], by default server of config file is used
+def runWorker() -> None:
+    config = configparser.RawConfigParser()
+    config.read(CONFIG_FILE)
+    host: str = sys.argv[1] if len(sys.argv) > 1 else config.get('analysisServer', 'host')
+    port: int = int(sys.argv[2]) if len(sys.argv) > 2 else config.getint('analysisServer', 'port')
+    worker = AnalysisWorker(config, host, port)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.pool.stop()
+
+
+if __name__ == '__main__':
+    runWorker()
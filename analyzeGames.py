@@ -0,0 +1,99 @@
+from typing import List, Union
+import argparse
+import csv
+import datetime
+import os
+import time
+from analysisCore import AnalysisCore, COLORS, MISTAKES_TABLE_HEADINGS, BAD_RESULTS_TABLE_HEADINGS
+from gamesFilter import TIME_CONTROLS, ANY_TIME_CONTROL
+
+CONFIG_FILE = 'config.cfg'
+RESULTS_WAIT_TIMEOUT = 0.5  # seconds to wait for engine results in single processing call
+
+
+## writes statistics table to csv file
+def writeTable(filename: str, headings: List[str], table: List[List[Union[int, str]]]) -> None:
+    with open(filename, encoding='utf-8', mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(headings)
+        writer.writerows(table)
+    print('{} rows written to {}'.format(len(table), filename))
+
+
+## parses date in format YYYY-MM-DD
+def parseDate(dateStr: str) -> datetime.date:
+    return datetime.datetime.strptime(dateStr, '%Y-%m-%d').date()
+
+
+## Batch analysis without UI: loads pgn, filters games, builds and analyzes combined pgn, saves statistics tables
+def analyzeGames() -> bool:
+    parser = argparse.ArgumentParser(description='Analyzes games of the player without UI')
+    parser.add_argument('pgn', help='pgn file with games of the player')
+    parser.add_argument('--player', help='player name (by default most frequent player in the file)')
+    parser.add_argument('--color', choices=COLORS, default=COLORS[0], help="player's color")
+    parser.add_argument('--from-date', type=parseDate, default=datetime.date(1900, 1, 1), help='YYYY-MM-DD')
+    parser.add_argument('--till-date', type=parseDate, default=datetime.date.today(), help='YYYY-MM-DD')
+    parser.add_argument('--min-elo', type=int, help='minimal elo of opponent')
+    parser.add_argument('--max-elo', type=int, help='maximal elo of opponent')
+    parser.add_argument('--time-control', choices=TIME_CONTROLS, default=ANY_TIME_CONTROL, help='time control of games')
+    parser.add_argument('--depth', type=int, help='engine search depth (by default engine.depth of config)')
+    parser.add_argument('--config', default=CONFIG_FILE, help='config file')
+    parser.add_argument('--format', choices=['pgn', 'sqlite'],
+                        help='format of combined game (by default combined.format of config)')
+    parser.add_argument('--moves', type=int, default=10, help='number of first moves in statistics tables')
+    parser.add_argument('--ignored-score', type=float, help='mistakes with bigger score are ignored '
+                                                            '(by default mistakesTable.initialIgnoreScore of config)')
+    parser.add_argument('--min-change', type=float, help='minimal change of mistake '
+                                                         '(by default mistakesTable.initialChange of config)')
+    args = parser.parse_args()
+
+    core = AnalysisCore(args.config)
+    if args.depth is not None:
+        core.config.set('engine', 'depth', str(args.depth))
+    if args.format is not None:
+        core.config.set('combined', 'format', args.format)
+    core.loadEcoBook()
+
+    core.filename = args.pgn
+    if not core.loadPgn():
+        return False
+    if args.player is not None:
+        core.player = args.player
+    core.filterGames(args.from_date, args.till_date, args.color, args.min_elo, args.max_elo, args.time_control)
+    print('{}: {} of {} games of {} by {}'.format(core.filename, len(core.filteredPgnGames), len(core.pgnAllGames),
+                                                 core.player, core.color))
+    if len(core.filteredPgnGames) == 0:
+        core.showError('No games of {} by {}'.format(core.player, core.color))
+        return False
+    if not core.buildCombinedPgn():
+        return False
+
+    # analysis
+    startTime = time.monotonic()
+    nodesNumber: int = core.totalNumberOfNodes
+    core.startAnalysis()
+    try:
+        while core.analysisState is not None:
+            core.processAnalysisResults(RESULTS_WAIT_TIMEOUT)
+    finally:
+        # combined pgn is saved on stop
+        core.stopAnalysis()
+    elapsed = time.monotonic() - startTime
+    print('{} nodes analyzed in {:.1f}s ({:.1f} nodes/s), combined pgn: {}'.format(
+        nodesNumber, elapsed, nodesNumber / elapsed if elapsed > 0 else 0.0, core.combinedFilename))
+
+    # statistics tables
+    baseFilename = os.path.splitext(core.combinedFilename)[0]
+    ignoredScore = args.ignored_score if args.ignored_score is not None else \
+        core.config.getfloat('mistakesTable', 'initialIgnoreScore')
+    minChange = args.min_change if args.min_change is not None else \
+        core.config.getfloat('mistakesTable', 'initialChange')
+    writeTable(baseFilename + '_mistakes.csv', MISTAKES_TABLE_HEADINGS,
+               core.buildMistakesTable(args.moves, ignoredScore, minChange, 'Change'))
+    writeTable(baseFilename + '_badresults.csv', BAD_RESULTS_TABLE_HEADINGS,
+               core.buildBadResultsTable(args.moves, 'Games'))
+    return True
+
+
+if __name__ == '__main__':
+    exit(0 if analyzeGames() else 1)
@@ -0,0 +1,127 @@
+from typing import Dict, List, Tuple
+from array import array
+import json
+import sqlite3
+import chess.pgn
+from positionTree import PositionTree
+from nodeTables import NodeTables, EvaluationStats
+from gameIndex import GameEntry, NO_OFFSET
+
+STORE_VERSION = 1  # version of combined store format
+TREE_ARRAYS = {'parents': 'i', 'firstChildren': 'i', 'nextSiblings': 'i', 'moves': 'H', 'plies': 'H',
+               'positionKeys': 'q', 'targets': 'i'}  # typed arrays of position tree and their type codes
+
+
+## returns typed array of blob
+def blobArray(typeCode: str, blob: bytes) -> array:
+    values = array(typeCode)
+    values.frombytes(blob)
+    return values
+
+
+## Combined game, its node tables and filtered games kept in single sqlite file instead of combined pgn. Tree and
+## games of nodes are kept as packed arrays (they are written once, when combined game is built), evaluations are
+## rows updated in place, so no journal is needed. Games are kept as headers and packed main line moves
+class CombinedStore:
+    filename: str  # sqlite database filename
+    connection: sqlite3.Connection  # connection to the database
+    flushInterval: int  # number of evaluation updates between commits
+    notCommitted: int  # number of evaluation updates after last commit
+
+    def __init__(self, filename: str, flushInterval: int = 1) -> None:
+        self.filename = filename
+        self.flushInterval = flushInterval
+        self.notCommitted = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    ## commits not committed evaluations
+    def commit(self) -> None:
+        self.connection.commit()
+        self.notCommitted = 0
+
+    ## commits and closes the store
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    ## writes whole combined game (previous content is replaced)
+    def save(self, tree: PositionTree, nodeTables: NodeTables, games: List[GameEntry], player: str, color: str,
+             nodesNumber: int) -> None:
+        with self.connection as connection:
+            for table in ['info', 'tree', 'evaluations', 'games']:
+                connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+            connection.execute('CREATE TABLE info (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            connection.execute('CREATE TABLE tree (name TEXT PRIMARY KEY, data BLOB NOT NULL)')
+            connection.execute('CREATE TABLE evaluations (node INTEGER PRIMARY KEY, score REAL NOT NULL, '
+                               'change REAL NOT NULL, bestMove TEXT, depth INTEGER NOT NULL)')
+            connection.execute('CREATE TABLE games (id INTEGER PRIMARY KEY, headers TEXT NOT NULL, '
+                               'moves BLOB NOT NULL)')
+
+            connection.executemany('INSERT INTO info (name, value) VALUES (?, ?)',
+                                   [('version', str(STORE_VERSION)), ('player', player), ('color', color),
+                                    ('gamesNumber', str(len(games))), ('nodesNumber', str(nodesNumber))])
+
+            # tree arrays, sans and games of nodes (numbers of games of every node and all the games one by one)
+            blobs: List[Tuple[str, bytes]] = [(name, getattr(tree, name).tobytes()) for name in TREE_ARRAYS]
+            blobs.append(('sans', '\n'.join(tree.sans).encode('utf-8')))
+            gamesNumbers = array('i', [len(nodeTables.getGames(nodeId)) for nodeId in range(len(tree))])
+            gameIds = array('i')
+            for nodeId in range(len(tree)):
+                gameIds.extend(nodeTables.getGames(nodeId))
+            blobs += [('gamesNumbers', gamesNumbers.tobytes()), ('gameIds', gameIds.tobytes())]
+            connection.executemany('INSERT INTO tree (name, data) VALUES (?, ?)', blobs)
+
+            connection.executemany('INSERT INTO evaluations (node, score, change, bestMove, depth) '
+                                   'VALUES (?, ?, ?, ?, ?)',
+                                   [(nodeId, evalStats.score, evalStats.change, evalStats.bestMove, evalStats.depth)
+                                    for nodeId, evalStats in ((nodeId, nodeTables.getEvaluation(nodeId))
+                                                              for nodeId in range(len(tree)))
+                                    if evalStats is not None])
+
+            connection.executemany('INSERT INTO games (id, headers, moves) VALUES (?, ?, ?)',
+                                   [(gameId, json.dumps(dict(entry.headers)),
+                                     entry.moves.tobytes())
+                                    for gameId, entry in enumerate(games)])
+        self.notCommitted = 0
+
+    ## loads combined game, node tables are filled from the store. Returns tree, games, player and number of nodes
+    def load(self, nodeTables: NodeTables) -> Tuple[PositionTree, List[GameEntry], str, int]:
+        info: Dict[str, str] = dict(self.connection.execute('SELECT name, value FROM info'))
+        if int(info['version']) != STORE_VERSION:
+            raise Exception('Combined store version {} is not supported'.format(info['version']))
+        blobs: Dict[str, bytes] = dict(self.connection.execute('SELECT name, data FROM tree'))
+
+        tree = PositionTree()
+        for name, typeCode in TREE_ARRAYS.items():
+            setattr(tree, name, blobArray(typeCode, blobs[name]))
+        tree.sans = blobs['sans'].decode('utf-8').split('\n')
+
+        nodeTables.clear()
+        nodeTables.ensureNode(len(tree) - 1)
+        gameIds: array = blobArray('i', blobs['gameIds'])
+        position: int = 0
+        for nodeId, gamesNumber in enumerate(blobArray('i', blobs['gamesNumbers'])):
+            nodeTables.gameIds[nodeId] = gameIds[position:position + gamesNumber]
+            position += gamesNumber
+        for nodeId, score, change, bestMove, depth in self.connection.execute(
+                'SELECT node, score, change, bestMove, depth FROM evaluations'):
+            nodeTables.setEvaluation(nodeId, EvaluationStats(score, change, bestMove, depth))
+
+        games: List[GameEntry] = [GameEntry(chess.pgn.Headers(json.loads(headers)), NO_OFFSET,
+                                            moves=blobArray('H', moves))
+                                  for headers, moves in self.connection.execute(
+                                      'SELECT headers, moves FROM games ORDER BY id')]
+        if len(games) != int(info['gamesNumber']):
+            raise Exception('Number of games in store is not correct')
+        return tree, games, info['player'], int(info['nodesNumber'])
+
+    ## updates evaluation of node in place, it is committed every flushInterval updates
+    def setEvaluation(self, nodeId: int, evalStats: EvaluationStats) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO evaluations (node, score, change, bestMove, depth) '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                (nodeId, evalStats.score, evalStats.change, evalStats.bestMove, evalStats.depth))
+        self.notCommitted += 1
+        if self.notCommitted >= self.flushInterval:
+            self.commit()
@@ -0,0 +1,137 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from array import array
+import os
+import struct
+import traceback
+import chess.pgn
+from positionKeys import boardKey, moveKey
+from positionTree import unpackMove
+from gameIndex import GameReader
+
+ECO_INDEX_EXTENSION = '.ecoidx'  # compiled eco book is eco book filename with this extension
+ECO_INDEX_MAGIC = b'ECIX'  # first bytes of compiled eco book
+ECO_INDEX_VERSION = 1  # version of compiled eco book format
+# magic, version, eco book size, eco book modification time (ns), number of positions, size of eco infos text
+ECO_INDEX_HEADER = struct.Struct('<4sIqqII')
+ECO_BOOK_ENCODING = 'latin-1'  # eco book is latin-1 encoded
+
+
+## class containes ECO (chess opening) info
+class EcoInfo:
+    ecoCode: str
+    opening: str
+    variant: str
+
+    def __init__(self, ecoCode: str, opening: str, variant: str) -> None:
+        self.ecoCode = ecoCode
+        self.opening = opening
+        self.variant = variant
+
+    # Returns short name
+    def shortName(self) -> str:
+        return '{} ({})'.format(self.opening, self.ecoCode)
+
+    # explanation in form code=opening, variant
+    def explanation(self) -> str:
+        return '{} = {}, {}'.format(self.ecoCode, self.opening, self.variant)
+
+    # string
+    def __str__(self):
+        return '{},{},{}'.format(self.ecoCode, self.opening, self.variant)
+
+    # returns hash for dictionary
+    def __hash__(self):
+        return hash(str(self))
+
+
+UNKNOWN_ECO_INFO = EcoInfo('None', 'None', 'None')  # eco info of positions out of eco book (or before it is applied)
+
+
+## reads eco book pgn, every game is opening line: Site header is eco code, White is opening and Black is variation.
+## Returns eco info of position key after every line, update gets position in the file
+def readEcoBook(ecoFilename: str, update: Callable[[int], None]) -> Dict[int, EcoInfo]:
+    keyToEcoInfo: Dict[int, EcoInfo] = {}
+    with open(ecoFilename, encoding=ECO_BOOK_ENCODING) as pgn:
+        while True:
+            read: Optional[Tuple[chess.pgn.Headers, array]] = chess.pgn.read_game(pgn, Visitor=GameReader)
+            if read is None:
+                break
+            headers, moves = read
+            openingVariation: str = headers['Black']
+            if openingVariation == '?':
+                openingVariation = 'None'
+
+            board: chess.Board = headers.board()
+            key: int = boardKey(board)
+            for packedMove in moves:
+                move: chess.Move = unpackMove(packedMove)
+                key = moveKey(key, board, move)
+                board.push(move)
+            keyToEcoInfo[key] = EcoInfo(headers['Site'], headers['White'], openingVariation)
+            update(pgn.tell())
+    return keyToEcoInfo
+
+
+## returns compiled eco book filename
+def ecoIndexFilename(ecoFilename: str) -> str:
+    return ecoFilename + ECO_INDEX_EXTENSION
+
+
+## saves compiled eco book next to the eco book, it is valid while eco book size and modification time are same.
+## Position keys are array, eco infos are tab separated lines of text in the same order
+def saveEcoIndex(ecoFilename: str, keyToEcoInfo: Dict[int, EcoInfo]) -> None:
+    try:
+        keys = array('q', keyToEcoInfo.keys())
+        text: bytes = '\n'.join(['\t'.join([ecoInfo.ecoCode, ecoInfo.opening, ecoInfo.variant])
+                                 for ecoInfo in keyToEcoInfo.values()]).encode('utf-8')
+        stat = os.stat(ecoFilename)
+        # compiled book is replaced at once, so it is never read half written
+        tmpFilename: str = ecoIndexFilename(ecoFilename) + '.tmp'
+        with open(tmpFilename, mode='wb') as file:
+            file.write(ECO_INDEX_HEADER.pack(ECO_INDEX_MAGIC, ECO_INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                             len(keys), len(text)))
+            file.write(keys.tobytes())
+            file.write(text)
+        os.replace(tmpFilename, ecoIndexFilename(ecoFilename))
+    except:
+        traceback.print_exc()
+        print('Unable to save compiled eco book of {}'.format(ecoFilename))
+
+
+## loads compiled eco book by single read, returns None if there is no compiled book or it is not valid for the book
+def loadEcoIndex(ecoFilename: str) -> Optional[Dict[int, EcoInfo]]:
+    try:
+        if not os.path.exists(ecoIndexFilename(ecoFilename)):
+            return None
+        with open(ecoIndexFilename(ecoFilename), mode='rb') as file:
+            data: bytes = file.read()
+        magic, version, size, mtime, keysNumber, textSize = ECO_INDEX_HEADER.unpack_from(data, 0)
+        stat = os.stat(ecoFilename)
+        if magic != ECO_INDEX_MAGIC or version != ECO_INDEX_VERSION or size != stat.st_size or \
+                mtime != stat.st_mtime_ns:
+            return None
+
+        position: int = ECO_INDEX_HEADER.size
+        keys = array('q')
+        keys.frombytes(data[position:position + keysNumber * keys.itemsize])
+        position += keysNumber * keys.itemsize
+        infos: List[EcoInfo] = [EcoInfo(*line.split('\t'))
+                                for line in data[position:position + textSize].decode('utf-8').split('\n')]
+        if len(infos) != keysNumber:
+            return None
+        return dict(zip(keys, infos))
+    except:
+        traceback.print_exc()
+        return None
+
+
+## returns eco infos of eco book from its compiled book, eco book is read (and compiled book is saved) if compiled
+## book is not valid. Update gets position in eco book
+def loadEcoInfos(ecoFilename: str, update: Callable[[int], None]) -> Dict[int, EcoInfo]:
+    keyToEcoInfo: Optional[Dict[int, EcoInfo]] = loadEcoIndex(ecoFilename)
+    if keyToEcoInfo is not None:
+        update(os.path.getsize(ecoFilename))
+        return keyToEcoInfo
+    keyToEcoInfo = readEcoBook(ecoFilename, update)
+    saveEcoIndex(ecoFilename, keyToEcoInfo)
+    return keyToEcoInfo
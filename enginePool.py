@@ -0,0 +1,184 @@
+from typing import Dict, List, Optional, Tuple
+import chess
+import chess.engine
+import asyncio
+import queue
+import threading
+import traceback
+
+ENGINE_QUIT_TIMEOUT = 5.0  # seconds engine has to quit before it is killed
+
+# MultiPV lines of the search: first move of line -> (score, best reply)
+AnalysisLines = Dict[chess.Move, Tuple[float, Optional[chess.Move]]]
+
+
+## calculates the score in format we regular (pawns)  from engine output
+def calcScore(score) -> float:
+    if score.is_mate():
+        if score.turn == chess.WHITE:
+            out_score = 1000.0
+        else:
+            out_score = -1000.0
+    else:
+        out_score = float((score.pov(chess.WHITE).score()) / 100.0)
+    return out_score
+
+
+## class describes position which should be analyzed by engine
+class AnalysisRequest:
+    key: object  # identifier of request, returned back in result
+    board: chess.Board  # position to analyze
+    depth: int  # depth of search
+    multiPV: int  # number of lines engine searches
+
+    def __init__(self, key: object, board: chess.Board, depth: int, multiPV: int = 1) -> None:
+        self.key = key
+        self.board = board
+        self.depth = depth
+        self.multiPV = multiPV
+
+
+## class describes engine result for specific request
+class AnalysisResult:
+    key: object  # identifier of request
+    depth: int  # depth of search
+    score: float  # score in pawns from white point of view
+    bestMove: Optional[chess.Move]  # best move in the position
+    lines: AnalysisLines  # MultiPV lines of the search
+
+    def __init__(self, key: object, depth: int, score: float, bestMove: Optional[chess.Move],
+                 lines: AnalysisLines) -> None:
+        self.key = key
+        self.depth = depth
+        self.score = score
+        self.bestMove = bestMove
+        self.lines = lines
+
+
+## returns result of finished game position (mate, stalemate or draw by rules) without search. Engine does not finish
+## infinite search of such position, it sends only depth 0 info
+def gameOverResult(request: AnalysisRequest) -> AnalysisResult:
+    score: float = 0.0
+    if request.board.is_checkmate():
+        # side to move is mated
+        score = -1000.0 if request.board.turn == chess.WHITE else 1000.0
+    return AnalysisResult(request.key, request.depth, score, None, {})
+
+
+## builds result of request from last infos of every line
+def buildResult(request: AnalysisRequest, infos: Dict[int, chess.engine.InfoDict]) -> AnalysisResult:
+    if 1 not in infos:
+        return AnalysisResult(request.key, request.depth, 0.0, None, {})
+    lines: AnalysisLines = {}
+    for info in infos.values():
+        pv: List[chess.Move] = info.get('pv', [])
+        if len(pv) > 0:
+            lines[pv[0]] = (calcScore(info.get('score')), pv[1] if len(pv) > 1 else None)
+    bestPv: List[chess.Move] = infos[1].get('pv', [])
+    return AnalysisResult(request.key, request.depth, calcScore(infos[1].get('score')),
+                          bestPv[0] if len(bestPv) > 0 else None, lines)
+
+
+## Pool of engine processes driven by asyncio event loop running in dedicated thread. Every engine task takes
+## positions from shared queue, so several analyses are in flight. Results are put to thread safe queue.
+class EnginePool:
+    enginePath: str  # path to engine executable
+    loop: asyncio.AbstractEventLoop  # event loop of engines
+    thread: threading.Thread  # thread runs event loop
+    requestsQueue: Optional[asyncio.Queue]  # positions waiting for analysis (belongs to event loop)
+    resultsQueue: queue.Queue  # analyzed positions
+    tasks: List[asyncio.Task]  # engine tasks
+    runningEngines: int  # number of engine tasks which are still working
+
+    def __init__(self, enginePath: str, enginesNumber: int) -> None:
+        self.enginePath = enginePath
+        self.resultsQueue = queue.Queue()
+        self.requestsQueue = None
+        self.tasks = []
+        self.runningEngines = max(enginesNumber, 1)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.loopThread, args=(self.runningEngines, started), daemon=True)
+        self.thread.start()
+        started.wait()
+
+    ## puts position to the analysis queue
+    def submit(self, request: AnalysisRequest) -> None:
+        self.loop.call_soon_threadsafe(self.requestsQueue.put_nowait, request)
+
+    ## returns next analyzed position or None if nothing came till timeout
+    def getResult(self, timeout: Optional[float] = None) -> Optional[AnalysisResult]:
+        try:
+            if timeout == 0:
+                return self.resultsQueue.get_nowait()
+            return self.resultsQueue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    ## returns True if at least one engine is still working
+    def isAlive(self) -> bool:
+        return self.runningEngines > 0
+
+    ## stops engines immediately, searches in flight are cancelled
+    def stop(self) -> None:
+        if not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.cancelTasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    ## cancels engine tasks and waits till engines quit
+    async def cancelTasks(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    ## event loop thread
+    def loopThread(self, enginesNumber: int, started: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.requestsQueue = asyncio.Queue()
+        self.tasks = [self.loop.create_task(self.engineTask(i)) for i in range(enginesNumber)]
+        started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    ## analyzes single position, in MultiPV mode waits till all the lines reach the depth
+    @staticmethod
+    async def analyze(engine: chess.engine.Protocol, request: AnalysisRequest) -> AnalysisResult:
+        if request.board.is_game_over():
+            return gameOverResult(request)
+        linesNumber: int = min(request.multiPV, request.board.legal_moves.count())
+        infos: Dict[int, chess.engine.InfoDict] = {}
+        with await engine.analysis(request.board, multipv=request.multiPV if request.multiPV > 1 else None,
+                                   options={'Contempt': 0}) as analisys:
+            async for info in analisys:
+                if info.get('score') is not None and info.get('depth') > request.depth:
+                    infos[info.get('multipv', 1)] = info
+                    if len(infos) >= linesNumber:
+                        break
+        return buildResult(request, infos)
+
+    ## engine task - takes positions from requests queue and puts results to results queue
+    async def engineTask(self, engineNumber: int) -> None:
+        print('engine {} started: path to engine={}'.format(engineNumber, self.enginePath))
+        transport: Optional[asyncio.SubprocessTransport] = None
+        engine: Optional[chess.engine.Protocol] = None
+        try:
+            transport, engine = await chess.engine.popen_uci(self.enginePath)
+            while True:
+                request: AnalysisRequest = await self.requestsQueue.get()
+                self.resultsQueue.put(await self.analyze(engine, request))
+        except asyncio.CancelledError:
+            pass
+        except:
+            traceback.print_exc()
+        finally:
+            self.runningEngines -= 1
+            if engine is not None:
+                try:
+                    await asyncio.wait_for(engine.quit(), ENGINE_QUIT_TIMEOUT)
+                except:
+                    transport.close()
+        print('engine {} EXIT'.format(engineNumber))
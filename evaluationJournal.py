@@ -0,0 +1,67 @@
+from typing import IO, Iterator, List, Optional, Tuple
+import chess
+import os
+
+
+## Append only journal of node evaluations, kept next to combined pgn till it is folded into the pgn.
+## Every line is: <moves from game start in uci> <tab> <score> <tab> <change> <tab> <best move in uci or empty> <tab>
+## <depth>. Later entry of same node replaces previous one
+class EvaluationJournal:
+    filename: str  # journal filename
+    file: Optional[IO]  # journal opened for append
+    flushInterval: int  # number of appended entries between flushes
+    notFlushed: int  # number of entries appended after last flush
+
+    def __init__(self, filename: str, flushInterval: int = 1) -> None:
+        self.filename = filename
+        self.file = None
+        self.flushInterval = flushInterval
+        self.notFlushed = 0
+
+    ## appends evaluation of node
+    def append(self, path: List[chess.Move], score: float, change: float, bestMove: Optional[str],
+               depth: int) -> None:
+        if self.file is None:
+            self.file = open(self.filename, encoding='utf-8', mode='a')
+        self.file.write('{}\t{}\t{}\t{}\t{}\n'.format(' '.join(move.uci() for move in path), score, change,
+                                                      bestMove if bestMove is not None else '', depth))
+        self.notFlushed += 1
+        if self.notFlushed >= self.flushInterval:
+            self.flush()
+
+    ## flushes appended entries to the disk
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+        self.notFlushed = 0
+
+    ## returns journal entries, entry which was not written completely is ignored
+    def replay(self) -> Iterator[Tuple[List[chess.Move], float, float, Optional[str], int]]:
+        self.flush()
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, encoding='utf-8') as file:
+            for line in file:
+                if not line.endswith('\n'):
+                    break
+                entry = line.rstrip('\n').split('\t')
+                if len(entry) != 5:
+                    continue
+                try:
+                    path = [chess.Move.from_uci(move) for move in entry[0].split()]
+                    yield path, float(entry[1]), float(entry[2]), entry[3] if entry[3] != '' else None, int(entry[4])
+                except ValueError:
+                    continue
+
+    ## closes journal file
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.notFlushed = 0
+
+    ## removes journal (after it was folded into the pgn)
+    def clear(self) -> None:
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
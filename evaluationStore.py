@@ -0,0 +1,97 @@
+from typing import Optional, Tuple
+import chess
+import chess.polyglot
+import csv
+import sqlite3
+import threading
+
+EXPORT_HEADER = ['key', 'depth', 'score', 'bestMove']
+
+
+## returns position key (zobrist hash) as signed 64 bit integer, so it can be sqlite integer key
+def positionKey(board: chess.Board) -> int:
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+## On disk evaluation store, shared between all combined pgns. For every position keeps deepest evaluation.
+class EvaluationStore:
+    filename: str  # sqlite database filename
+    local: threading.local  # every thread works with own connection
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS evaluations '
+                               '(key INTEGER PRIMARY KEY, depth INTEGER NOT NULL, score REAL NOT NULL, bestMove TEXT)')
+
+    ## returns connection of current thread
+    def connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30)
+            # write ahead log lets readers work concurrently with writer
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    ## closes connection of current thread
+    def close(self) -> None:
+        connection: Optional[sqlite3.Connection] = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    ## returns score, best move (uci) and depth of position if it was searched at least to the given depth
+    def get(self, key: int, depth: int) -> Optional[Tuple[float, Optional[str], int]]:
+        row = self.connection().execute('SELECT score, bestMove, depth FROM evaluations WHERE key = ? AND depth >= ?',
+                                        (key, depth)).fetchone()
+        return None if row is None else (row[0], row[1], row[2])
+
+    ## stores score of position, deeper evaluation already in store is not replaced
+    def put(self, key: int, depth: int, score: float, bestMove: Optional[str] = None) -> None:
+        with self.connection() as connection:
+            connection.execute('INSERT INTO evaluations (key, depth, score, bestMove) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, score = excluded.score, '
+                               'bestMove = excluded.bestMove WHERE excluded.depth > evaluations.depth',
+                               (key, depth, score, bestMove))
+
+    ## returns number of positions in store
+    def size(self) -> int:
+        return self.connection().execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+
+    ## exports store to csv file, returns number of exported positions
+    def exportTo(self, filename: str) -> int:
+        exported = 0
+        with open(filename, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_HEADER)
+            for row in self.connection().execute('SELECT key, depth, score, bestMove FROM evaluations ORDER BY key'):
+                writer.writerow(row)
+                exported += 1
+        return exported
+
+    ## imports csv file exported by another analyst, returns number of read positions
+    def importFrom(self, filename: str) -> int:
+        imported = 0
+
+        def readRows(reader):
+            nonlocal imported
+            for row in reader:
+                imported += 1
+                yield int(row[0]), int(row[1]), float(row[2]), row[3] if row[3] != '' else None
+
+        with open(filename, newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header != EXPORT_HEADER:
+                raise Exception('{} is not evaluations export file'.format(filename))
+            with self.connection() as connection:
+                connection.executemany('INSERT INTO evaluations (key, depth, score, bestMove) VALUES (?, ?, ?, ?) '
+                                       'ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, '
+                                       'score = excluded.score, bestMove = excluded.bestMove '
+                                       'WHERE excluded.depth > evaluations.depth',
+                                       readRows(reader))
+        return imported
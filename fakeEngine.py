@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+from typing import List, Optional, Tuple
+import argparse
+import os
+import sys
+import threading
+import chess
+import chess.polyglot
+
+MAX_SCORE = 200  # static scores are in range [-MAX_SCORE, MAX_SCORE] centipawns
+
+
+## deterministic static score of the position in centipawns from white point of view
+def positionScore(board: chess.Board) -> int:
+    return chess.polyglot.zobrist_hash(board) % (2 * MAX_SCORE + 1) - MAX_SCORE
+
+
+## returns score from point of view of side to move
+def relativeScore(board: chess.Board, score: int) -> int:
+    return score if board.turn == chess.WHITE else -score
+
+
+## Fake UCI engine for benchmarks and tests. Search is one ply: line score is static score of the position after the
+## move, so score of the searched position is score of its best line whatever MultiPV is (same position always gets
+## same score). Every depth takes depthLatency seconds, so scheduling and I/O overhead can be measured separately from
+## search time
+class FakeEngine:
+    board: chess.Board  # position to search
+    multiPV: int  # number of lines to search
+    depthLatency: float  # seconds every depth of search takes
+    maxDepth: int  # depth infinite search stops at (waiting for stop command)
+    searchThread: Optional[threading.Thread]  # running search
+    stopEvent: threading.Event  # says to running search to stop
+    outputLock: threading.Lock  # lock for stdout used by search thread and commands loop
+
+    def __init__(self, depthLatency: float, maxDepth: int) -> None:
+        self.board = chess.Board()
+        self.multiPV = 1
+        self.depthLatency = depthLatency
+        self.maxDepth = maxDepth
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.outputLock = threading.Lock()
+
+    ## writes line to the gui
+    def output(self, line: str) -> None:
+        with self.outputLock:
+            sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+
+    ## uci command: engine identification and options
+    def uci(self) -> None:
+        self.output('id name FakeEngine')
+        self.output('id author GamesAnalyzer')
+        self.output('option name Contempt type spin default 0 min -100 max 100')
+        self.output('option name MultiPV type spin default 1 min 1 max 500')
+        self.output('uciok')
+
+    ## setoption command: setoption name <name> value <value>
+    def setOption(self, parts: List[str]) -> None:
+        if 'name' not in parts or 'value' not in parts:
+            return
+        name = ' '.join(parts[parts.index('name') + 1:parts.index('value')])
+        value = ' '.join(parts[parts.index('value') + 1:])
+        if name == 'MultiPV':
+            self.multiPV = max(int(value), 1)
+
+    ## position command: position [startpos | fen <fen>] [moves <moves>]
+    def position(self, parts: List[str]) -> None:
+        movesIndex = parts.index('moves') if 'moves' in parts else len(parts)
+        if parts[1] == 'fen':
+            self.board = chess.Board(' '.join(parts[2:movesIndex]))
+        else:
+            self.board = chess.Board()
+        for move in parts[movesIndex + 1:]:
+            self.board.push_uci(move)
+
+    ## returns best move for side to move: move to the position with best static score
+    @staticmethod
+    def bestMove(board: chess.Board) -> Optional[chess.Move]:
+        lines = FakeEngine.searchLines(board, 1)
+        return lines[0][1] if len(lines) > 0 else None
+
+    ## returns best lines of the position: (score from point of view of side to move, move), best line first
+    @staticmethod
+    def searchLines(board: chess.Board, linesNumber: int) -> List[Tuple[int, chess.Move]]:
+        lines: List[Tuple[int, chess.Move]] = []
+        for move in board.legal_moves:
+            board.push(move)
+            # position after the move is scored from point of view of side made the move
+            lines.append((-relativeScore(board, positionScore(board)), move))
+            board.pop()
+        lines.sort(key=lambda x: (-x[0], x[1].uci()))
+        return lines[:linesNumber]
+
+    ## search thread, every depth takes depthLatency. Infinite search waits for stop after maxDepth
+    def search(self, board: chess.Board, multiPV: int, depthLimit: Optional[int]) -> None:
+        if board.is_game_over():
+            self.output('info depth 0 score {}'.format('mate 0' if board.is_checkmate() else 'cp 0'))
+            if depthLimit is None:
+                self.stopEvent.wait()
+            self.output('bestmove (none)')
+            return
+
+        # MultiPV lines are position after the move and best reply of the opponent
+        lines: List[Tuple[int, List[chess.Move]]] = []
+        for score, move in self.searchLines(board, multiPV):
+            board.push(move)
+            reply: Optional[chess.Move] = self.bestMove(board)
+            board.pop()
+            lines.append((score, [move] + ([reply] if reply is not None else [])))
+
+        depth: int = 0
+        while depth < (depthLimit if depthLimit is not None else self.maxDepth):
+            if self.stopEvent.wait(self.depthLatency):
+                break
+            depth += 1
+            for lineNumber in range(len(lines)):
+                score, pv = lines[lineNumber]
+                self.output('info depth {} seldepth {} multipv {} score cp {} nodes {} pv {}'.format(
+                    depth, depth, lineNumber + 1, score, depth * 1000, ' '.join(move.uci() for move in pv)))
+        if depthLimit is None:
+            self.stopEvent.wait()
+        self.output('bestmove {}{}'.format(lines[0][1][0].uci(),
+                                           ' ponder {}'.format(lines[0][1][1].uci()) if len(lines[0][1]) > 1 else ''))
+
+    ## go command: go [depth <depth>] [infinite], other limits are treated as infinite search
+    def go(self, parts: List[str]) -> None:
+        self.stop()
+        depthLimit: Optional[int] = int(parts[parts.index('depth') + 1]) if 'depth' in parts else None
+        self.stopEvent.clear()
+        self.searchThread = threading.Thread(target=self.search, args=(self.board.copy(), self.multiPV, depthLimit))
+        self.searchThread.start()
+
+    ## stop command: stops running search, search outputs best move
+    def stop(self) -> None:
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    ## reads commands from the gui till quit
+    def run(self) -> None:
+        for line in sys.stdin:
+            parts = line.split()
+            if len(parts) == 0:
+                continue
+            command = parts[0]
+            if command == 'uci':
+                self.uci()
+            elif command == 'isready':
+                self.output('readyok')
+            elif command == 'setoption':
+                self.setOption(parts)
+            elif command == 'ucinewgame':
+                self.stop()
+            elif command == 'position':
+                self.position(parts)
+            elif command == 'go':
+                self.go(parts)
+            elif command == 'stop':
+                self.stop()
+            elif command == 'quit':
+                break
+        self.stop()
+
+
+## runs fake engine, latency can be set by arguments or by environment variables (when engine is started by
+## python-chess without arguments)
+def runFakeEngine() -> None:
+    parser = argparse.ArgumentParser(description='Fake UCI engine with deterministic scores')
+    parser.add_argument('--depth-latency', type=float,
+                        default=float(os.environ.get('FAKE_ENGINE_DEPTH_LATENCY', '0.001')),
+                        help='seconds every depth of search takes (FAKE_ENGINE_DEPTH_LATENCY)')
+    parser.add_argument('--max-depth', type=int, default=int(os.environ.get('FAKE_ENGINE_MAX_DEPTH', '64')),
+                        help='depth infinite search stops at (FAKE_ENGINE_MAX_DEPTH)')
+    args = parser.parse_args()
+    FakeEngine(args.depth_latency, args.max_depth).run()
+
+
+if __name__ == '__main__':
+    runFakeEngine()
@@ -0,0 +1,319 @@
+from typing import Callable, IO, List, Optional, Tuple
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+import struct
+import traceback
+import zlib
+import chess
+import chess.pgn
+from positionTree import packMove, unpackMove
+
+NO_OFFSET = -1  # offset of game which is not read from pgn file (it is already parsed)
+NO_ELO = -1  # elo of player without rating in the index
+INDEX_EXTENSION = '.idx'  # sidecar index file is pgn filename with this extension
+INDEX_MAGIC = b'GAIX'  # first bytes of index file
+INDEX_VERSION = 2  # version of index file format
+INDEX_HEADER = struct.Struct('<4sIqqI')  # magic, version, pgn size, pgn modification time (ns), number of games
+INDEX_RECORD = struct.Struct('<qIhh')  # offset, moves hash, white elo, black elo (followed by strings)
+INDEX_STRING = struct.Struct('<H')  # length of utf-8 string
+INDEX_TAGS = ['Date', 'White', 'Black', 'Result', 'Variant', 'TimeControl']  # headers kept in the index as strings
+OPTIONAL_INDEX_TAGS = ['Variant', 'TimeControl']  # index headers which are not set when they are empty
+PARALLEL_SCAN_MIN_SIZE = 8 * 1024 * 1024  # smaller pgn files are scanned by single process
+RANGES_PER_PROCESS = 4  # number of byte ranges pgn is split to for every process (for progress and balancing)
+GAME_START_REGEX = re.compile(rb'\n\r?\n\[')  # empty line followed by header line starts a game
+
+
+## Game of pgn file known by its headers and position in the file. Game moves are parsed only when they are needed
+## and kept as packed main line moves (16 bits per move), chess.pgn.Game is rebuilt only for the export
+class GameEntry:
+    headers: chess.pgn.Headers  # headers of the game (only INDEX_TAGS and elos if entry is read from the index)
+    offset: int  # position of the game in pgn file, NO_OFFSET if game is already parsed
+    moveHash: int  # hash of main line moves (crc32 of san), identifies same games in different files
+    moves: Optional[array]  # packed main line moves (packMove), None till game is read
+
+    def __init__(self, headers: chess.pgn.Headers, offset: int, moveHash: int = 0,
+                 moves: Optional[array] = None) -> None:
+        self.headers = headers
+        self.offset = offset
+        self.moveHash = moveHash
+        self.moves = moves
+
+    ## creates entry of already parsed game
+    @classmethod
+    def fromGame(cls, game: chess.pgn.Game):
+        return cls(game.headers, NO_OFFSET, moves=array('H', [packMove(move) for move in game.mainline_moves()]))
+
+    ## returns board of the game start
+    def board(self) -> chess.Board:
+        return self.headers.board()
+
+    ## returns game moves
+    def mainlineMoves(self) -> List[chess.Move]:
+        return [unpackMove(packedMove) for packedMove in self.moves]
+
+    ## rebuilds the game (headers and main line) for the export
+    def toGame(self) -> chess.pgn.Game:
+        game = chess.pgn.Game(self.headers)
+        node: chess.pgn.GameNode = game
+        for move in self.mainlineMoves():
+            node = node.add_variation(move)
+        return game
+
+
+## returns elo of pgn elo header to be kept in the index
+def indexElo(elo: Optional[str]) -> int:
+    return int(elo) if elo is not None and elo.isdigit() and int(elo) < 1 << 15 else NO_ELO
+
+
+## returns compact record of game kept in the index and passed from scanning processes: offset, moves hash, white elo,
+## black elo and values of INDEX_TAGS
+def gameRecord(offset: int, headers: chess.pgn.Headers, moveHash: int) -> Tuple:
+    return (offset, moveHash, indexElo(headers.get('WhiteElo')), indexElo(headers.get('BlackElo'))) + \
+        tuple(headers.get(tag, '') for tag in INDEX_TAGS)
+
+
+## returns game entry of compact record, headers are only the headers kept in the record
+def recordEntry(record: Tuple) -> GameEntry:
+    offset, moveHash, whiteElo, blackElo = record[:4]
+    headers = chess.pgn.Headers()
+    for tag, value in zip(INDEX_TAGS, record[4:]):
+        # empty optional tag is header which is not set
+        if value != '' or tag not in OPTIONAL_INDEX_TAGS:
+            headers[tag] = value
+    for tag, elo in [('WhiteElo', whiteElo), ('BlackElo', blackElo)]:
+        if elo != NO_ELO:
+            headers[tag] = str(elo)
+    return GameEntry(headers, offset, moveHash)
+
+
+## Visitor for chess.pgn.read_game collecting headers and hash of main line moves. San of moves is hashed as it is
+## written without parsing (null move is pushed instead), variations are skipped
+class GameScanner(chess.pgn.BaseVisitor):
+    headers: chess.pgn.Headers  # headers of the game
+    sans: List[str]  # main line moves
+
+    def begin_game(self) -> None:
+        # same defaults of seven tag roster as in games read by chess.pgn.read_game
+        self.headers = chess.pgn.Headers()
+        self.sans = []
+
+    def begin_headers(self) -> chess.pgn.Headers:
+        return self.headers
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def parse_san(self, board: chess.Board, san: str) -> chess.Move:
+        self.sans.append(san.rstrip('+#'))
+        return chess.Move.null()
+
+    def handle_error(self, error: Exception) -> None:
+        # games with broken moves or setup are still indexed, they are reported when parsed
+        pass
+
+    def result(self) -> Tuple[chess.pgn.Headers, int]:
+        return self.headers, zlib.crc32(' '.join(self.sans).encode('utf-8'))
+
+
+## Visitor for chess.pgn.read_game collecting headers and packed main line moves without building chess.pgn.Game,
+## variations and comments are skipped
+class GameReader(chess.pgn.BaseVisitor):
+    headers: chess.pgn.Headers  # headers of the game
+    moves: array  # packed main line moves
+
+    def begin_game(self) -> None:
+        self.headers = chess.pgn.Headers()
+        self.moves = array('H')
+
+    def begin_headers(self) -> chess.pgn.Headers:
+        return self.headers
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move) -> None:
+        self.moves.append(packMove(move))
+
+    def handle_error(self, error: Exception) -> None:
+        # moves after the broken one are skipped (as chess.pgn.read_game does)
+        print('Error in game {} - {}: {}'.format(self.headers.get('White', '?'), self.headers.get('Black', '?'), error))
+
+    def result(self) -> Tuple[chess.pgn.Headers, array]:
+        return self.headers, self.moves
+
+
+## reads next game of pgn as entry with packed moves, returns None at the end of the file
+def readGameEntry(pgn: IO, offset: int = NO_OFFSET) -> Optional[GameEntry]:
+    read: Optional[Tuple[chess.pgn.Headers, array]] = chess.pgn.read_game(pgn, Visitor=GameReader)
+    if read is None:
+        return None
+    return GameEntry(read[0], offset, moves=read[1])
+
+
+## scans headers and moves hashes of all the games of pgn file without parsing moves, update gets position in the file
+def scanGames(pgn: IO, update: Callable[[int], None]) -> List[GameEntry]:
+    entries: List[GameEntry] = []
+    while True:
+        offset: int = pgn.tell()
+        scanned: Optional[Tuple[chess.pgn.Headers, int]] = chess.pgn.read_game(pgn, Visitor=GameScanner)
+        if scanned is None:
+            break
+        entries.append(GameEntry(scanned[0], offset, scanned[1]))
+        update(offset)
+    return entries
+
+
+## scans games of byte range of pgn file (range starts at game start), returns compact records (gameRecord) of games
+## starting in the range. Runs in worker process
+def scanRange(pgnFilename: str, start: int, end: int) -> List[Tuple]:
+    records: List[Tuple] = []
+    with open(pgnFilename, encoding='utf-8') as pgn:
+        pgn.seek(start)
+        while True:
+            offset: int = pgn.tell()
+            if offset >= end:
+                break
+            scanned: Optional[Tuple[chess.pgn.Headers, int]] = chess.pgn.read_game(pgn, Visitor=GameScanner)
+            if scanned is None:
+                break
+            records.append(gameRecord(offset, scanned[0], scanned[1]))
+    return records
+
+
+## splits pgn file to byte ranges at games starts, every range has about same size
+def splitRanges(pgnFilename: str, rangesNumber: int) -> List[Tuple[int, int]]:
+    size: int = os.path.getsize(pgnFilename)
+    starts: List[int] = [0]
+    with open(pgnFilename, mode='rb') as pgn:
+        for i in range(1, rangesNumber):
+            position: int = max(size * i // rangesNumber, starts[-1])
+            pgn.seek(position)
+            # game start is looked for in growing chunks (game may be longer than chunk)
+            chunkSize: int = 64 * 1024
+            while True:
+                chunk: bytes = pgn.read(chunkSize)
+                match = GAME_START_REGEX.search(chunk)
+                if match is not None:
+                    starts.append(position + match.end() - 1)
+                    break
+                if len(chunk) < chunkSize:
+                    break
+                # chunk is read again from its end minus possible part of the separator
+                position += len(chunk) - 3
+                pgn.seek(position)
+                chunkSize *= 2
+    starts = sorted(set(starts))
+    return [(starts[i], starts[i + 1] if i + 1 < len(starts) else size) for i in range(len(starts))]
+
+
+## scans pgn file by several processes, every process scans byte ranges of the file. Games are returned in the file
+## order, update gets position in the file
+def scanGamesParallel(pgnFilename: str, processes: int, update: Callable[[int], None]) -> List[GameEntry]:
+    ranges: List[Tuple[int, int]] = splitRanges(pgnFilename, processes * RANGES_PER_PROCESS)
+    entries: List[GameEntry] = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # map returns results in the order of ranges
+        for records in executor.map(scanRange, [pgnFilename] * len(ranges), [start for start, end in ranges],
+                                    [end for start, end in ranges]):
+            for record in records:
+                entries.append(recordEntry(record))
+            if len(entries) > 0:
+                update(entries[-1].offset)
+    return entries
+
+
+## reads moves (and all the headers) of entries which are not read yet, update gets number of read games
+def readGames(filename: str, entries: List[GameEntry], update: Callable[[int], None]) -> None:
+    with open(filename, encoding='utf-8') as pgn:
+        i: int = 0
+        for entry in entries:
+            if entry.moves is None:
+                pgn.seek(entry.offset)
+                read: GameEntry = readGameEntry(pgn, entry.offset)
+                entry.headers = read.headers
+                entry.moves = read.moves
+            i += 1
+            update(i)
+
+
+## returns sidecar index filename of pgn
+def indexFilename(pgnFilename: str) -> str:
+    return pgnFilename + INDEX_EXTENSION
+
+
+## saves index of pgn games next to the pgn, index is valid while pgn size and modification time are same
+def saveIndex(pgnFilename: str, entries: List[GameEntry]) -> None:
+    try:
+        stat = os.stat(pgnFilename)
+        chunks: List[bytes] = [INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                                 len(entries))]
+        for entry in entries:
+            record: Tuple = gameRecord(entry.offset, entry.headers, entry.moveHash)
+            chunks.append(INDEX_RECORD.pack(*record[:4]))
+            for tagValue in record[4:]:
+                value: bytes = tagValue.encode('utf-8')
+                chunks.append(INDEX_STRING.pack(len(value)))
+                chunks.append(value)
+        # index is replaced at once, so it is never read half written
+        tmpFilename: str = indexFilename(pgnFilename) + '.tmp'
+        with open(tmpFilename, mode='wb') as file:
+            file.write(b''.join(chunks))
+        os.replace(tmpFilename, indexFilename(pgnFilename))
+    except:
+        traceback.print_exc()
+        print('Unable to save index of {}'.format(pgnFilename))
+
+
+## loads index of pgn games, returns None if there is no index or it is not valid for current pgn
+def loadIndex(pgnFilename: str) -> Optional[List[GameEntry]]:
+    try:
+        if not os.path.exists(indexFilename(pgnFilename)):
+            return None
+        with open(indexFilename(pgnFilename), mode='rb') as file:
+            data: bytes = file.read()
+        magic, version, size, mtime, gamesNumber = INDEX_HEADER.unpack_from(data, 0)
+        stat = os.stat(pgnFilename)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or size != stat.st_size or mtime != stat.st_mtime_ns:
+            return None
+
+        entries: List[GameEntry] = []
+        position: int = INDEX_HEADER.size
+        for i in range(gamesNumber):
+            record: Tuple = INDEX_RECORD.unpack_from(data, position)
+            position += INDEX_RECORD.size
+            for tag in INDEX_TAGS:
+                length: int = INDEX_STRING.unpack_from(data, position)[0]
+                position += INDEX_STRING.size
+                record += (data[position:position + length].decode('utf-8'),)
+                position += length
+            entries.append(recordEntry(record))
+        return entries
+    except:
+        traceback.print_exc()
+        return None
+
+
+## returns games of pgn file from its index, pgn is scanned (and index is saved) if index is not valid. Big files are
+## scanned by processes (0 for number of cpus, 1 for scanning without processes). Update gets position in the file
+def loadGameEntries(pgnFilename: str, processes: int, update: Callable[[int], None]) -> List[GameEntry]:
+    entries: Optional[List[GameEntry]] = loadIndex(pgnFilename)
+    if entries is not None:
+        update(os.path.getsize(pgnFilename))
+        return entries
+    if processes == 0:
+        processes = os.cpu_count() or 1
+    if processes > 1 and os.path.getsize(pgnFilename) >= PARALLEL_SCAN_MIN_SIZE:
+        entries = scanGamesParallel(pgnFilename, processes, update)
+    else:
+        with open(pgnFilename, encoding='utf-8') as pgn:
+            entries = scanGames(pgn, update)
+    saveIndex(pgnFilename, entries)
+    return entries
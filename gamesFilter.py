@@ -0,0 +1,114 @@
+from typing import Dict, List, Optional, Set, Tuple
+from array import array
+from bisect import bisect_left, bisect_right
+import datetime
+from gameIndex import GameEntry
+from gamesSummary import NO_DATE, parseDate, parseElo
+
+ANY_TIME_CONTROL = 'Any'  # time control of filter which takes games of all time controls
+CORRESPONDENCE = 'Correspondence'  # time control of daily games (moves per days)
+UNKNOWN_TIME_CONTROL = 'Unknown'  # time control of games without time control header
+TIME_CONTROLS = [ANY_TIME_CONTROL, 'Bullet', 'Blitz', 'Rapid', 'Classical', CORRESPONDENCE]  # time controls of filter
+# game has time control of first limit above its estimated seconds (base + 40 increments), longer games are classical
+TIME_CONTROL_LIMITS = [(180, 'Bullet'), (480, 'Blitz'), (1500, 'Rapid')]
+OPPONENT_COLORS = {'White': 'Black', 'Black': 'White'}  # color of opponent of every color
+
+
+## returns date ordinal of pgn date (yyyy.mm.dd), NO_DATE if date is not full
+def dateOrdinal(dateStr: str) -> int:
+    gameDate: Optional[datetime.date] = parseDate(dateStr)
+    return gameDate.toordinal() if gameDate is not None else NO_DATE
+
+
+## returns time control of pgn time control header ("base+increment" in seconds, "moves/seconds" for daily games)
+def timeControlClass(timeControl: str) -> str:
+    if '/' in timeControl:
+        return CORRESPONDENCE
+    try:
+        parts: List[str] = timeControl.split('+')
+        estimatedTime: int = int(parts[0]) + (40 * int(parts[1]) if len(parts) > 1 else 0)
+    except ValueError:
+        return UNKNOWN_TIME_CONTROL
+    for limit, timeControlName in TIME_CONTROL_LIMITS:
+        if estimatedTime < limit:
+            return timeControlName
+    return 'Classical'
+
+
+## Games of the player by one color. Dates and opponent elos are sorted with game ids in the same order, so ranges are
+## found by bisect
+class PlayerGames:
+    dates: array  # sorted date ordinals of games with full date
+    dateIds: array  # game id of every date
+    opponentElos: array  # sorted elos of rated opponents
+    opponentEloIds: array  # game id of every opponent elo
+    timeControlIds: Dict[str, array]  # game ids of every time control
+
+    def __init__(self, dates: List[Tuple[int, int]], opponentElos: List[Tuple[int, int]],
+                 timeControlIds: Dict[str, List[int]]) -> None:
+        dates.sort()
+        opponentElos.sort()
+        self.dates = array('i', [value for value, gameId in dates])
+        self.dateIds = array('i', [gameId for value, gameId in dates])
+        self.opponentElos = array('i', [value for value, gameId in opponentElos])
+        self.opponentEloIds = array('i', [gameId for value, gameId in opponentElos])
+        self.timeControlIds = {timeControl: array('i', ids) for timeControl, ids in timeControlIds.items()}
+
+
+## Index of loaded games by player and color for filtering. It is built once when pgn is loaded, then every filter is
+## bisect of dates (and opponent elos) plus intersection of game ids, games headers are not read again
+class GamesFilter:
+    players: Dict[Tuple[str, str], PlayerGames]  # games of (player, color)
+
+    def __init__(self) -> None:
+        self.players = {}
+
+    ## clears the index
+    def clear(self) -> None:
+        self.players = {}
+
+    ## builds index of the games, game id is index of the game in entries
+    def build(self, entries: List[GameEntry]) -> None:
+        dates: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        opponentElos: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        timeControlIds: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+        for gameId, entry in enumerate(entries):
+            gameDate: int = dateOrdinal(entry.headers.get('Date', '?'))
+            timeControl: str = timeControlClass(entry.headers.get('TimeControl', '-'))
+            for color, opponentColor in OPPONENT_COLORS.items():
+                key: Tuple[str, str] = (entry.headers.get(color, '?'), color)
+                if key not in dates:
+                    dates[key] = []
+                    opponentElos[key] = []
+                    timeControlIds[key] = {}
+                if gameDate != NO_DATE:
+                    dates[key].append((gameDate, gameId))
+                opponentElo: int = parseElo(entry.headers.get(opponentColor + 'Elo', '?'))
+                if opponentElo >= 0:
+                    opponentElos[key].append((opponentElo, gameId))
+                timeControlIds[key].setdefault(timeControl, []).append(gameId)
+        self.players = {key: PlayerGames(dates[key], opponentElos[key], timeControlIds[key]) for key in dates}
+
+    ## returns ids (in ascending order) of games of the player by the color between the dates. Optional opponent elo
+    ## range and time control (ANY_TIME_CONTROL for all the games) narrow the games, games without full date, opponent
+    ## elo or time control are not taken by the corresponding filter
+    def filter(self, player: str, color: str, fromDate: datetime.date, tillDate: datetime.date,
+               minElo: Optional[int] = None, maxElo: Optional[int] = None,
+               timeControl: str = ANY_TIME_CONTROL) -> List[int]:
+        playerGames: Optional[PlayerGames] = self.players.get((player, color))
+        if playerGames is None:
+            return []
+        dateIds: array = playerGames.dateIds[bisect_left(playerGames.dates, fromDate.toordinal()):
+                                             bisect_right(playerGames.dates, tillDate.toordinal())]
+        if minElo is None and maxElo is None and timeControl == ANY_TIME_CONTROL:
+            return sorted(dateIds)
+
+        gameIds: Set[int] = set(dateIds)
+        if minElo is not None or maxElo is not None:
+            start: int = bisect_left(playerGames.opponentElos, minElo) if minElo is not None else 0
+            end: int = bisect_right(playerGames.opponentElos, maxElo) if maxElo is not None \
+                else len(playerGames.opponentElos)
+            gameIds.intersection_update(playerGames.opponentEloIds[start:end])
+        if timeControl != ANY_TIME_CONTROL:
+            gameIds.intersection_update(playerGames.timeControlIds.get(timeControl, []))
+        return sorted(gameIds)
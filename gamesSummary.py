@@ -0,0 +1,103 @@
+from typing import List, Optional
+from array import array
+import datetime
+import chess.pgn
+from gameIndex import GameEntry
+
+WHITE_WINS = 0  # result code of 1-0
+BLACK_WINS = 1  # result code of 0-1
+DRAW = 2  # result code of 1/2-1/2
+UNKNOWN_RESULT = 3  # result code of unfinished game
+RESULT_STRS = ['1-0', '0-1', '1/2-1/2', '*']  # result of every result code
+NO_DATE = 0  # date ordinal of game without full date
+NO_ELO = -1  # elo of player without rating
+
+
+## returns short name of the player: "Surname N." for "Surname, Name", otherwise name without spaces
+def shortName(fullName: str) -> str:
+    nameParts: List[str] = fullName.replace(' ', '').split(',')
+    if len(nameParts) > 1 and len(nameParts[1]) > 0:
+        return '{} {}.'.format(nameParts[0], nameParts[1][0])
+    return nameParts[0]
+
+
+## returns result code of pgn result
+def resultCode(result: str) -> int:
+    result = result.replace(' ', '')
+    return RESULT_STRS.index(result) if result in RESULT_STRS[:UNKNOWN_RESULT] else UNKNOWN_RESULT
+
+
+## returns date of pgn date (yyyy.mm.dd), None if date is not full. Date is split instead of strptime, which is much
+## slower for thousands of games
+def parseDate(dateStr: str) -> Optional[datetime.date]:
+    try:
+        year, month, day = dateStr.split('.')
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+## returns elo of pgn elo header, NO_ELO if it is not a number
+def parseElo(elo: str) -> int:
+    return int(elo) if elo.isdigit() else NO_ELO
+
+
+## Columns of filtered games headers parsed once, when games are filtered or loaded from combined pgn. Columns are
+## indexed by game id (index in filtered games), so node statistics and tables rows are made by game id lookup
+## without reading pgn headers
+class GamesSummary:
+    dates: array  # date ordinal, NO_DATE if date is not full
+    dateStrs: List[str]  # date shown in tables (dd/mm/yy)
+    whiteNames: List[str]  # short name of white player
+    blackNames: List[str]  # short name of black player
+    whiteElos: array  # elo of white player, NO_ELO if unknown
+    blackElos: array  # elo of black player, NO_ELO if unknown
+    results: array  # result code
+
+    def __init__(self) -> None:
+        self.dates = array('i')
+        self.dateStrs = []
+        self.whiteNames = []
+        self.blackNames = []
+        self.whiteElos = array('i')
+        self.blackElos = array('i')
+        self.results = array('b')
+
+    ## returns number of games
+    def __len__(self) -> int:
+        return len(self.results)
+
+    ## clears all the columns
+    def clear(self) -> None:
+        self.__init__()
+
+    ## appends game headers to the columns
+    def addGame(self, headers: chess.pgn.Headers) -> None:
+        gameDate: Optional[datetime.date] = parseDate(headers.get('Date', '?'))
+        if gameDate is not None:
+            self.dates.append(gameDate.toordinal())
+            self.dateStrs.append(gameDate.strftime('%d/%m/%y'))
+        else:
+            self.dates.append(NO_DATE)
+            self.dateStrs.append('')
+        self.whiteNames.append(shortName(headers.get('White', '?')))
+        self.blackNames.append(shortName(headers.get('Black', '?')))
+        self.whiteElos.append(parseElo(headers.get('WhiteElo', '?')))
+        self.blackElos.append(parseElo(headers.get('BlackElo', '?')))
+        self.results.append(resultCode(headers.get('Result', '*')))
+
+    ## rebuilds the columns from the game entries
+    def build(self, entries: List[GameEntry]) -> None:
+        self.clear()
+        for entry in entries:
+            self.addGame(entry.headers)
+
+    ## returns elo shown in tables
+    @staticmethod
+    def eloStr(elo: int) -> str:
+        return str(elo) if elo != NO_ELO else '?'
+
+    ## returns game row of node statistics table: date, white, white elo, black, black elo, result
+    def row(self, gameId: int) -> List[str]:
+        return [self.dateStrs[gameId], self.whiteNames[gameId], self.eloStr(self.whiteElos[gameId]),
+                self.blackNames[gameId], self.eloStr(self.blackElos[gameId]), RESULT_STRS[self.results[gameId]]]
@@ -6,10 +6,14 @@ from analysisTab import AnalysisTab
 from chessBoardUI import ChessBoardUI
 
 CONFIG_FILE = 'config.cfg'
+ANALYSIS_POLL_TIMEOUT = 100  # milliseconds window waits for event before analysis results are processed
 
 
 def playGame():
-    menu_def = [['&File', ['&Open', 'Open &Combined Pgn', 'E&xit']], ['&Board', ['&Flip']]]
+    menu_def = [['&File', ['&Open', 'Open &Combined Pgn', 'Com&pact Combined Pgn',
+                           'Export Co&mbined Pgn', '&Export Evaluations',
+                           '&Import Evaluations', 'E&xit']],
+                ['&Board', ['&Flip']]]
     sg.ChangeLookAndFeel('BrownBlue')
     chess_board = chess.pgn.Game().board()
     # create initial board setup
@@ -34,7 +38,8 @@ def playGame():
 
     # ---===--- Loop taking in user input --- #
     while True:
-        button, value = window.Read()
+        # timeout lets analysis tab process engine results
+        button, value = window.Read(timeout=ANALYSIS_POLL_TIMEOUT)
 
         if button == 'Exit':
             window.Close()
@@ -55,12 +60,39 @@ def playGame():
         if button == 'Open Combined Pgn':
             filename = sg.PopupGetFile('Open combined database', title='Open combined database', no_window=True,
                                        default_extension="pgn",
-                                       file_types=(('PGN Files', '*.pgn'),))
+                                       file_types=(('PGN Files', '*.pgn'), ('Combined Store Files', '*.sqlite')))
             if filename is not None and filename != '':
                 analysisTab.setCombinedFilename(filename, value)
             else:
                 print('Cancel')
 
+        if button == 'Compact Combined Pgn':
+            analysisTab.compactCombinedPgn()
+
+        if button == 'Export Combined Pgn':
+            filename = sg.PopupGetFile('Export combined pgn', title='Export combined pgn', no_window=True,
+                                       save_as=True, default_extension="pgn", file_types=(('PGN Files', '*.pgn'),))
+            if filename is not None and filename != '':
+                analysisTab.exportCombinedPgn(filename)
+            else:
+                print('Cancel')
+
+        if button == 'Export Evaluations':
+            filename = sg.PopupGetFile('Export evaluations', title='Export evaluations', no_window=True,
+                                       save_as=True, default_extension="csv", file_types=(('CSV Files', '*.csv'),))
+            if filename is not None and filename != '':
+                analysisTab.exportEvaluations(filename)
+            else:
+                print('Cancel')
+
+        if button == 'Import Evaluations':
+            filename = sg.PopupGetFile('Import evaluations', title='Import evaluations', no_window=True,
+                                       default_extension="csv", file_types=(('CSV Files', '*.csv'),))
+            if filename is not None and filename != '':
+                analysisTab.importEvaluations(filename)
+            else:
+                print('Cancel')
+
         info = databaseTab.onEvent(window, button)
         if info is not None:
             analysisTab.setFilename(info.filename)
@@ -71,9 +103,10 @@ def playGame():
         # check events in engine tab class
         chessBoardUI.onEvent(window, button, value)
 
-    analysisTab.exitThread()
+    analysisTab.stopAnalysis()
     chessBoardUI.stopUI()
     print("EXIT\n")
 
 
-playGame()
+if __name__ == '__main__':
+    playGame()
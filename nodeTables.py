@@ -0,0 +1,173 @@
+from typing import List, Optional, Tuple
+from array import array
+import math
+import chess
+from positionTree import PositionTree, ROOT, UNRESOLVED
+from gamesSummary import WHITE_WINS, BLACK_WINS, DRAW, UNKNOWN_RESULT
+
+REFERENCE_COMMENT = '@'  # pgn comment of node which is reference to another node with same position
+
+
+## class for evaluation node statistics
+class EvaluationStats:
+    score: float
+    change: float
+    bestMove: Optional[str]  # best move in the position (uci), if known
+    depth: int  # depth of search
+
+    def __init__(self, score: float, change: float, bestMove: Optional[str], depth: int) -> None:
+        self.score = score
+        self.change = change
+        self.bestMove = bestMove
+        self.depth = depth
+
+    def toCommentStr(self) -> str:
+        return '&{} &{} &{} &{}'.format(self.score, self.change, self.bestMove if self.bestMove is not None else '',
+                                        self.depth)
+
+    def scoreStr(self) -> str:
+        return '%.2f' % self.score
+
+    def changeStr(self) -> str:
+        return '%.2f' % self.change
+
+    def depthStr(self) -> str:
+        return str(self.depth)
+
+    # returns best move in san format
+    def bestMoveSan(self, board: chess.Board) -> str:
+        if self.bestMove is None:
+            return ''
+        return board.san(chess.Move.from_uci(self.bestMove))
+
+    @classmethod
+    def fromComment(cls, commentStr: str):
+        info = commentStr.split('&')
+        if len(info) != 5:
+            return None
+        bestMove = info[3].strip()
+        return cls(float(info[1]), float(info[2]), bestMove if bestMove != '' else None, int(info[4]))
+
+
+## Per node data of combined game kept in typed side tables indexed by node id of position tree: games passing through
+## node, their results counts and evaluation. Pgn comments format (games numbers "3,17,42,", '@' for transposition and
+## evaluation "&score &change &best &depth") is produced only when combined pgn is written and parsed only when it is
+## read
+class NodeTables:
+    gameIds: List[array]  # ids of filtered games passing through node
+    scores: array  # score of node, NaN if node is not evaluated
+    changes: array  # score change relatively to parent
+    depths: array  # depth of search
+    bestMoves: List[Optional[str]]  # best move in node position (uci), if known
+    whiteWins: array  # number of games passing through node white won (made by countResults)
+    blackWins: array  # number of games passing through node black won
+    draws: array  # number of drawn games passing through node
+
+    def __init__(self) -> None:
+        self.gameIds = []
+        self.scores = array('d')
+        self.changes = array('d')
+        self.depths = array('i')
+        self.bestMoves = []
+        self.whiteWins = array('i')
+        self.blackWins = array('i')
+        self.draws = array('i')
+
+    ## clears all the tables
+    def clear(self) -> None:
+        self.__init__()
+
+    ## extends the tables up to the node
+    def ensureNode(self, nodeId: int) -> None:
+        while len(self.bestMoves) <= nodeId:
+            self.gameIds.append(array('i'))
+            self.scores.append(math.nan)
+            self.changes.append(0.0)
+            self.depths.append(0)
+            self.bestMoves.append(None)
+
+    ## adds game passing through node
+    def addGame(self, nodeId: int, gameId: int) -> None:
+        self.ensureNode(nodeId)
+        self.gameIds[nodeId].append(gameId)
+
+    ## removes all the games of node (node became transposition)
+    def clearGames(self, nodeId: int) -> None:
+        self.ensureNode(nodeId)
+        del self.gameIds[nodeId][:]
+
+    ## returns ids of games passing through node
+    def getGames(self, nodeId: int) -> array:
+        return self.gameIds[nodeId] if nodeId < len(self.gameIds) else array('i')
+
+    ## returns number of games passing through node
+    def getGamesNumber(self, nodeId: int) -> int:
+        return len(self.getGames(nodeId))
+
+    ## counts results of games passing through every node in one pass, results are result codes of games (by game id)
+    def countResults(self, results: array) -> None:
+        nodesNumber: int = len(self.gameIds)
+        self.whiteWins = array('i', [0]) * nodesNumber
+        self.blackWins = array('i', [0]) * nodesNumber
+        self.draws = array('i', [0]) * nodesNumber
+        counts: List[Optional[array]] = [None] * (UNKNOWN_RESULT + 1)  # counts of every result code
+        counts[WHITE_WINS] = self.whiteWins
+        counts[BLACK_WINS] = self.blackWins
+        counts[DRAW] = self.draws
+        for nodeId in range(nodesNumber):
+            for gameId in self.gameIds[nodeId]:
+                result: int = results[gameId]
+                if result != UNKNOWN_RESULT:
+                    counts[result][nodeId] += 1
+
+    ## returns numbers of white wins, black wins and draws of games passing through node
+    def getResults(self, nodeId: int) -> Tuple[int, int, int]:
+        if nodeId >= len(self.whiteWins):
+            return 0, 0, 0
+        return self.whiteWins[nodeId], self.blackWins[nodeId], self.draws[nodeId]
+
+    ## sets evaluation of node (instead of previous one if exists)
+    def setEvaluation(self, nodeId: int, evalStats: EvaluationStats) -> None:
+        self.ensureNode(nodeId)
+        self.scores[nodeId] = evalStats.score
+        self.changes[nodeId] = evalStats.change
+        self.depths[nodeId] = evalStats.depth
+        self.bestMoves[nodeId] = evalStats.bestMove
+
+    ## returns evaluation of node or None if node is not evaluated yet
+    def getEvaluation(self, nodeId: int) -> Optional[EvaluationStats]:
+        if nodeId >= len(self.scores) or math.isnan(self.scores[nodeId]):
+            return None
+        return EvaluationStats(self.scores[nodeId], self.changes[nodeId], self.bestMoves[nodeId], self.depths[nodeId])
+
+    ## returns pgn comment of node, root comment starts with number of games in combined pgn
+    def nodeComment(self, tree: PositionTree, nodeId: int, gamesNumber: int) -> str:
+        if tree.isTransposition(nodeId):
+            return REFERENCE_COMMENT
+        if nodeId == ROOT:
+            comment: str = str(gamesNumber)
+        else:
+            comment: str = ''.join('{},'.format(gameId) for gameId in self.getGames(nodeId))
+        evalStats: Optional[EvaluationStats] = self.getEvaluation(nodeId)
+        if evalStats is not None:
+            comment += evalStats.toCommentStr()
+        return comment
+
+    ## reads tables from comments of combined game nodes, transpositions are marked in the tree (UNRESOLVED).
+    ## Returns number of games
+    def readComments(self, tree: PositionTree, comments: List[str]) -> int:
+        self.clear()
+        self.ensureNode(len(tree) - 1)
+        gamesNumber: int = int(comments[ROOT].split('&')[0])
+        for nodeId in range(len(comments)):
+            comment: str = comments[nodeId]
+            if comment == REFERENCE_COMMENT:
+                tree.setTarget(nodeId, UNRESOLVED)
+                continue
+            if nodeId != ROOT:
+                for gameId in comment.split('&')[0].split(',')[:-1]:
+                    self.gameIds[nodeId].append(int(gameId))
+            evalStats: Optional[EvaluationStats] = EvaluationStats.fromComment(comment)
+            if evalStats is not None:
+                self.setEvaluation(nodeId, evalStats)
+        return gamesNumber
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+from typing import List
+import argparse
+import os
+import time
+from gameIndex import GameEntry, gameRecord, scanGames, scanGamesParallel
+
+
+## returns True if both scans found same games (compact records of the index)
+def sameEntries(entries: List[GameEntry], otherEntries: List[GameEntry]) -> bool:
+    return [gameRecord(entry.offset, entry.headers, entry.moveHash) for entry in entries] == \
+        [gameRecord(entry.offset, entry.headers, entry.moveHash) for entry in otherEntries]
+
+
+## compares time of sequential pgn scan and scan by processes (byte ranges of the file scanned in parallel)
+def runBenchmark() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark of sequential and parallel pgn loading')
+    parser.add_argument('pgn', help='pgn file')
+    parser.add_argument('--processes', type=int, default=0, help='number of processes (0 for number of cpus)')
+    args = parser.parse_args()
+    processes: int = args.processes if args.processes > 0 else (os.cpu_count() or 1)
+
+    start = time.time()
+    with open(args.pgn, encoding='utf-8') as pgn:
+        entries: List[GameEntry] = scanGames(pgn, lambda x: None)
+    sequentialTime: float = time.time() - start
+    print('sequential: {} games in {:.2f}s'.format(len(entries), sequentialTime))
+
+    start = time.time()
+    parallelEntries: List[GameEntry] = scanGamesParallel(args.pgn, processes, lambda x: None)
+    parallelTime: float = time.time() - start
+    print('{} processes: {} games in {:.2f}s'.format(processes, len(parallelEntries), parallelTime))
+    print('speedup {:.2f}x, same games: {}'.format(sequentialTime / parallelTime, sameEntries(entries,
+                                                                                          parallelEntries)))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,70 @@
+import chess
+import chess.polyglot
+
+MASK_64 = (1 << 64) - 1  # keys are 64 bits
+HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)  # polyglot zobrist hashing
+CASTLING_KEYS = [(chess.BB_H1, chess.polyglot.POLYGLOT_RANDOM_ARRAY[768]),
+                 (chess.BB_A1, chess.polyglot.POLYGLOT_RANDOM_ARRAY[769]),
+                 (chess.BB_H8, chess.polyglot.POLYGLOT_RANDOM_ARRAY[770]),
+                 (chess.BB_A8, chess.polyglot.POLYGLOT_RANDOM_ARRAY[771])]  # rook square of castling right and its key
+TURN_KEY = chess.polyglot.POLYGLOT_RANDOM_ARRAY[780]  # key of white to move
+
+
+## converts unsigned 64 bits key to signed one (so it fits into signed 64 bits arrays and sqlite)
+def toSigned(key: int) -> int:
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+## returns key of piece on square
+def pieceKey(pieceType: chess.PieceType, color: chess.Color, square: chess.Square) -> int:
+    return chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((pieceType - 1) * 2 + int(color)) + square]
+
+
+## returns key of castling rights (bitboard of rooks squares)
+def castlingKey(castlingRights: chess.Bitboard) -> int:
+    key: int = 0
+    for rookSquare, rookKey in CASTLING_KEYS:
+        if castlingRights & rookSquare:
+            key ^= rookKey
+    return key
+
+
+## Position key: polyglot zobrist hash of pieces placement, side to move and castling rights. En passant square is
+## not the part of the key, so positions are same exactly when fen parts before en passant square are same. The key
+## is signed 64 bits
+def boardKey(board: chess.Board) -> int:
+    return toSigned(HASHER.hash_board(board) ^ HASHER.hash_castling(board) ^ HASHER.hash_turn(board))
+
+
+## returns key of the position after the move, board is position before the move (it is not changed). Key is updated
+## incrementally, only by pieces the move changes
+def moveKey(key: int, board: chess.Board, move: chess.Move) -> int:
+    key &= MASK_64
+    color: chess.Color = board.turn
+    pieceType: chess.PieceType = board.piece_type_at(move.from_square)
+    key ^= pieceKey(pieceType, color, move.from_square)
+    castlingRights: chess.Bitboard = board.castling_rights
+    newCastlingRights: chess.Bitboard = castlingRights & ~chess.BB_SQUARES[move.from_square] & \
+        ~chess.BB_SQUARES[move.to_square]
+
+    if board.is_castling(move):
+        # king and rook moves, python-chess castling move may be king to rook square
+        rank: int = chess.square_rank(move.from_square)
+        kingside: bool = board.is_kingside_castling(move)
+        key ^= pieceKey(chess.KING, color, chess.square(6 if kingside else 2, rank))
+        key ^= pieceKey(chess.ROOK, color, chess.square(7 if kingside else 0, rank))
+        key ^= pieceKey(chess.ROOK, color, chess.square(5 if kingside else 3, rank))
+    else:
+        if board.is_en_passant(move):
+            key ^= pieceKey(chess.PAWN, not color, move.to_square + (-8 if color == chess.WHITE else 8))
+        else:
+            capturedType: chess.PieceType = board.piece_type_at(move.to_square)
+            if capturedType is not None:
+                key ^= pieceKey(capturedType, not color, move.to_square)
+        key ^= pieceKey(move.promotion if move.promotion is not None else pieceType, color, move.to_square)
+
+    if pieceType == chess.KING:
+        newCastlingRights &= ~(chess.BB_RANK_1 if color == chess.WHITE else chess.BB_RANK_8)
+    if newCastlingRights != castlingRights:
+        key ^= castlingKey(castlingRights) ^ castlingKey(newCastlingRights)
+    return toSigned(key ^ TURN_KEY)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+from typing import Dict, List
+import argparse
+import time
+import chess
+import chess.pgn
+from positionKeys import boardKey, moveKey
+
+
+## reads moves of all the games of pgn file
+def readGamesMoves(pgnPath: str, maxGames: int) -> List[List[chess.Move]]:
+    gamesMoves: List[List[chess.Move]] = []
+    with open(pgnPath) as pgn:
+        while maxGames == 0 or len(gamesMoves) < maxGames:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            gamesMoves.append(list(game.mainline_moves()))
+    return gamesMoves
+
+
+## position key as it was made from fen: everything before en passant square
+def fenPrefixKey(board: chess.Board) -> str:
+    return board.fen().split('-')[0]
+
+
+## fen prefix without move counters (they get into the prefix when castling is possible and en passant square is set)
+def fenPositionKey(board: chess.Board) -> str:
+    return ' '.join(board.fen().split(' ')[:3])
+
+
+## keys every position of the games by fen prefix, returns map from key to number of positions
+def keyByFen(gamesMoves: List[List[chess.Move]]) -> Dict[str, int]:
+    keys: Dict[str, int] = {}
+    for moves in gamesMoves:
+        board = chess.Board()
+        for move in moves:
+            board.push(move)
+            key: str = fenPrefixKey(board)
+            keys[key] = keys.get(key, 0) + 1
+    return keys
+
+
+## keys every position of the games by incremental zobrist key, returns map from key to number of positions
+def keyByZobrist(gamesMoves: List[List[chess.Move]]) -> Dict[int, int]:
+    keys: Dict[int, int] = {}
+    startKey: int = boardKey(chess.Board())
+    for moves in gamesMoves:
+        board = chess.Board()
+        key: int = startKey
+        for move in moves:
+            key = moveKey(key, board, move)
+            board.push(move)
+            keys[key] = keys.get(key, 0) + 1
+    return keys
+
+
+## checks that zobrist keys identify same positions as fen prefix (without move counters), returns number of
+## mismatches
+def checkKeys(gamesMoves: List[List[chess.Move]]) -> int:
+    fenToKey: Dict[str, int] = {}
+    keyToFen: Dict[int, str] = {}
+    mismatches: int = 0
+    for moves in gamesMoves:
+        board = chess.Board()
+        key: int = boardKey(board)
+        for move in moves:
+            key = moveKey(key, board, move)
+            board.push(move)
+            fen: str = fenPositionKey(board)
+            if fenToKey.setdefault(fen, key) != key or keyToFen.setdefault(key, fen) != fen:
+                mismatches += 1
+    return mismatches
+
+
+## compares time of keying all the positions of pgn file by fen prefix and by incremental zobrist keys. Boards are
+## replayed in both cases, so the difference is the keying cost
+def runBenchmark() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark of fen prefix and zobrist position keys')
+    parser.add_argument('pgn', help='pgn file')
+    parser.add_argument('--games', type=int, default=0, help='maximal number of games to read (0 for all)')
+    args = parser.parse_args()
+
+    start = time.time()
+    gamesMoves: List[List[chess.Move]] = readGamesMoves(args.pgn, args.games)
+    positionsNumber: int = sum(len(moves) for moves in gamesMoves)
+    print('{} games, {} positions read in {:.2f}s'.format(len(gamesMoves), positionsNumber, time.time() - start))
+
+    start = time.time()
+    fenKeys: Dict[str, int] = keyByFen(gamesMoves)
+    fenTime: float = time.time() - start
+    print('fen prefix keys: {:.2f}s, {} different positions'.format(fenTime, len(fenKeys)))
+
+    start = time.time()
+    zobristKeys: Dict[int, int] = keyByZobrist(gamesMoves)
+    zobristTime: float = time.time() - start
+    print('zobrist keys:    {:.2f}s, {} different positions'.format(zobristTime, len(zobristKeys)))
+    print('speedup {:.2f}x'.format(fenTime / zobristTime))
+    print('{} key mismatches'.format(checkKeys(gamesMoves)))
+
+
+if __name__ == '__main__':
+    runBenchmark()
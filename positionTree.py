@@ -0,0 +1,242 @@
+from typing import Callable, Dict, List, Optional
+from array import array
+from collections import OrderedDict
+import chess
+import chess.pgn
+from positionKeys import boardKey, moveKey
+
+ROOT = 0  # id of the root node (start position)
+NO_NODE = -1  # no node: no parent, child or sibling, node is not a transposition
+UNRESOLVED = -2  # transposition which target is not known yet (tree is read from pgn)
+BOARD_CACHE_SIZE = 4096  # number of boards kept by BoardCache
+
+
+## packs move into 16 bits: from square (6 bits), to square (6 bits), promotion piece type (3 bits)
+def packMove(move: chess.Move) -> int:
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+## unpacks move packed by packMove
+def unpackMove(packedMove: int) -> chess.Move:
+    promotion: int = packedMove >> 12
+    return chess.Move(packedMove & 0x3f, (packedMove >> 6) & 0x3f, promotion if promotion != 0 else None)
+
+
+## Compact tree of positions of combined game. Nodes are integer ids (root is ROOT), tree structure is kept in
+## parent/first child/next sibling arrays, every node has its move packed into 16 bits, its san and position hash.
+## Transposition node has no children, it is an edge to the node with same position (so tree is actually DAG).
+## Tree is converted to chess.pgn.Game only for export
+class PositionTree:
+    parents: array  # parent of node, NO_NODE for root
+    firstChildren: array  # first child of node, NO_NODE if node has no children
+    nextSiblings: array  # next child of node parent, NO_NODE for last child
+    moves: array  # move leading to node, packed by packMove (0 for root)
+    plies: array  # number of half moves from start position
+    positionKeys: array  # position key (boardKey), same for transpositions
+    targets: array  # node with same position transposition node leads to, NO_NODE if node is not a transposition
+    sans: List[str]  # move leading to node in san format ('' for root)
+
+    def __init__(self) -> None:
+        self.parents = array('i', [NO_NODE])
+        self.firstChildren = array('i', [NO_NODE])
+        self.nextSiblings = array('i', [NO_NODE])
+        self.moves = array('H', [0])
+        self.plies = array('H', [0])
+        self.positionKeys = array('q', [boardKey(chess.Board())])
+        self.targets = array('i', [NO_NODE])
+        self.sans = ['']
+
+    ## returns number of nodes
+    def __len__(self) -> int:
+        return len(self.sans)
+
+    ## adds child of parent node, board is position of the parent. Child is added after all other children
+    def addNode(self, parent: int, move: chess.Move, board: chess.Board, san: Optional[str] = None) -> int:
+        nodeId: int = len(self.sans)
+        self.sans.append(san if san is not None else board.san(move))
+        self.positionKeys.append(moveKey(self.positionKeys[parent], board, move))
+        self.parents.append(parent)
+        self.firstChildren.append(NO_NODE)
+        self.nextSiblings.append(NO_NODE)
+        self.moves.append(packMove(move))
+        self.plies.append(self.plies[parent] + 1)
+        self.targets.append(NO_NODE)
+
+        # link as last child
+        if self.firstChildren[parent] == NO_NODE:
+            self.firstChildren[parent] = nodeId
+        else:
+            child: int = self.firstChildren[parent]
+            while self.nextSiblings[child] != NO_NODE:
+                child = self.nextSiblings[child]
+            self.nextSiblings[child] = nodeId
+        return nodeId
+
+    ## returns move leading to node, None for root
+    def move(self, nodeId: int) -> Optional[chess.Move]:
+        return unpackMove(self.moves[nodeId]) if nodeId != ROOT else None
+
+    ## returns children of node in their order
+    def children(self, nodeId: int) -> List[int]:
+        result: List[int] = []
+        child: int = self.firstChildren[nodeId]
+        while child != NO_NODE:
+            result.append(child)
+            child = self.nextSiblings[child]
+        return result
+
+    ## returns child of node with the move, NO_NODE if there is no such child
+    def findChild(self, nodeId: int, move: chess.Move) -> int:
+        packedMove: int = packMove(move)
+        child: int = self.firstChildren[nodeId]
+        while child != NO_NODE and self.moves[child] != packedMove:
+            child = self.nextSiblings[child]
+        return child
+
+    ## reorders children of node according to key (stable)
+    def sortChildren(self, nodeId: int, key: Callable[[int], int]) -> None:
+        children: List[int] = sorted(self.children(nodeId), key=key)
+        if len(children) == 0:
+            return
+        self.firstChildren[nodeId] = children[0]
+        for i in range(len(children) - 1):
+            self.nextSiblings[children[i]] = children[i + 1]
+        self.nextSiblings[children[-1]] = NO_NODE
+
+    ## returns True if node is a transposition (edge to another node with same position)
+    def isTransposition(self, nodeId: int) -> bool:
+        return self.targets[nodeId] != NO_NODE
+
+    ## makes node a transposition to target (UNRESOLVED if target is not known yet)
+    def setTarget(self, nodeId: int, target: int) -> None:
+        assert (self.firstChildren[nodeId] == NO_NODE)
+        self.targets[nodeId] = target
+
+    ## returns color of side which made the move of the node
+    def moveColor(self, nodeId: int) -> bool:
+        return chess.WHITE if self.plies[nodeId] % 2 == 1 else chess.BLACK
+
+    ## returns moves from the start position to the node
+    def path(self, nodeId: int) -> List[chess.Move]:
+        path: List[chess.Move] = []
+        while nodeId != ROOT:
+            path.append(unpackMove(self.moves[nodeId]))
+            nodeId = self.parents[nodeId]
+        path.reverse()
+        return path
+
+    ## returns position of the node
+    def board(self, nodeId: int) -> chess.Board:
+        board = chess.Board()
+        for move in self.path(nodeId):
+            board.push(move)
+        return board
+
+    ## returns node reached from the root by the moves, NO_NODE if there is no such node
+    def findPath(self, path: List[chess.Move]) -> int:
+        nodeId: int = ROOT
+        for move in path:
+            nodeId = self.findChild(nodeId, move)
+            if nodeId == NO_NODE:
+                break
+        return nodeId
+
+    ## converts tree to chess.pgn.Game for export, comment returns comment of node
+    def toGame(self, comment: Callable[[int], str]) -> chess.pgn.Game:
+        game = chess.pgn.Game()
+        game.comment = comment(ROOT)
+        gameNodes: Dict[int, chess.pgn.GameNode] = {ROOT: game}
+        for nodeId in range(1, len(self.sans)):
+            # parent is always added before its children
+            gameNode: chess.pgn.GameNode = gameNodes[self.parents[nodeId]].add_variation(self.move(nodeId),
+                                                                                      comment=comment(nodeId))
+            gameNodes[nodeId] = gameNode
+
+        # children order
+        for nodeId, gameNode in gameNodes.items():
+            gameNode.variations = [gameNodes[child] for child in self.children(nodeId)]
+        return game
+
+
+## Positions of tree nodes carried down the tree instead of replaying every path from the root. Board of node is made
+## from the closest cached ancestor by pushing the moves down to the node, so nodes visited in BFS or DFS order cost a
+## board copy and one move. Recently used boards are kept (up to BOARD_CACHE_SIZE), returned boards must not be changed
+class BoardCache:
+    tree: PositionTree  # tree boards belong to
+    rootBoard: chess.Board  # start position
+    boards: OrderedDict  # node to its board, least recently used first
+
+    def __init__(self, tree: PositionTree) -> None:
+        self.tree = tree
+        self.rootBoard = chess.Board()
+        self.boards = OrderedDict()
+
+    ## returns position of the node (shared with the cache, must not be changed)
+    def board(self, nodeId: int) -> chess.Board:
+        if nodeId == ROOT:
+            return self.rootBoard
+        if nodeId in self.boards:
+            self.boards.move_to_end(nodeId)
+            return self.boards[nodeId]
+
+        # moves from the closest cached ancestor
+        moves: List[int] = []
+        ancestor: int = nodeId
+        while ancestor != ROOT and ancestor not in self.boards:
+            moves.append(self.tree.moves[ancestor])
+            ancestor = self.tree.parents[ancestor]
+        board: chess.Board = self.board(ancestor).copy(stack=False)
+        for packedMove in reversed(moves):
+            board.push(unpackMove(packedMove))
+
+        self.boards[nodeId] = board
+        if len(self.boards) > BOARD_CACHE_SIZE:
+            self.boards.popitem(last=False)
+        return board
+
+
+## Visitor for chess.pgn.read_game, builds position tree directly from pgn (without chess.pgn.Game). Headers and
+## comments of the nodes are kept in the visitor
+class PositionTreeBuilder(chess.pgn.BaseVisitor):
+    tree: PositionTree  # tree being built
+    headers: Dict[str, str]  # headers of the game
+    comments: List[str]  # comment of every node
+    variationStack: List[int]  # current node of every open variation
+    inVariation: bool  # True if comment belongs to current node (it is not a comment before variation move)
+    san: Optional[str]  # san token of the move being parsed (standard san without check or mate suffix)
+
+    def begin_game(self) -> None:
+        self.tree = PositionTree()
+        self.headers = {}
+        self.comments = ['']
+        self.variationStack = [ROOT]
+        self.inVariation = False
+        self.san = None
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self) -> None:
+        self.variationStack.append(self.tree.parents[self.variationStack[-1]])
+        self.inVariation = False
+
+    def end_variation(self) -> None:
+        self.variationStack.pop()
+
+    def visit_comment(self, comment: str) -> None:
+        nodeId: int = self.variationStack[-1]
+        if self.inVariation or (nodeId == ROOT and self.tree.firstChildren[ROOT] == NO_NODE):
+            self.comments[nodeId] = ' '.join(filter(None, [self.comments[nodeId], comment]))
+
+    def begin_parse_san(self, board: chess.Board, san: str) -> None:
+        self.san = san
+
+    def visit_move(self, board: chess.Board, move: chess.Move) -> None:
+        # pgn tokenizer drops '+' and '#', so san of checking moves is built from the board
+        san: Optional[str] = self.san if not board.gives_check(move) else None
+        self.variationStack[-1] = self.tree.addNode(self.variationStack[-1], move, board, san)
+        self.comments.append('')
+        self.inVariation = True
+
+    def result(self) -> PositionTree:
+        return self.tree